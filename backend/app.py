@@ -14,27 +14,43 @@ import os
 import json
 import base64
 from datetime import datetime, timedelta, date
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, safe_join, send_file as werkzeug_send_file
+from werkzeug.exceptions import NotFound
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask import Flask, request, jsonify, session, send_from_directory
+from flask import Flask, request, jsonify, session, g, has_app_context, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import text, inspect
 from flask_cors import CORS
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps
 import io
 import uuid
 import random
+import hashlib
+import threading
+import functools
+import concurrent.futures
+import queue
 try:
-    from openai import AzureOpenAI
+    from openai import AzureOpenAI, APIConnectionError
+    import httpx
     _openai_available = True
 except Exception:  # pragma: no cover - optional dependency
     AzureOpenAI = None
+    APIConnectionError = None
+    httpx = None
     _openai_available = False
 import numpy as np
-from collections import Counter
+from collections import Counter, OrderedDict
 import logging
 import re
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+import sqlite3
+import csv
 import requests
+import click
+from requests.adapters import HTTPAdapter
 
 
 app = Flask(__name__)
@@ -42,6 +58,98 @@ app.config['SECRET_KEY'] = 'nutrivision-revolutionary-2024'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///nutrivision_pro.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# Vocabulário alimentar externo (SQLite gerado por `flask build-food-vocabulary`);
+# se o ficheiro não existir usa-se o vocabulário embutido
+app.config['FOOD_VOCABULARY_PATH'] = os.environ.get(
+    'FOOD_VOCABULARY_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'food_vocabulary.db')
+)
+# Tabela de nutrientes por 100 g usada nas estimativas por texto antes do GPT
+app.config['NUTRIENT_TABLE_PATH'] = os.environ.get(
+    'NUTRIENT_TABLE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'nutrients.csv')
+)
+
+# Análise numa única chamada de visão (o gate "é comida?" vem na própria resposta)
+app.config['AI_SINGLE_PASS_ANALYSIS'] = True
+
+# Pré-processamento das fotos antes de irem para o GPT-4o (lado maior em px + qualidade JPEG).
+# O GPT-4o reduz tudo para ~768px no lado menor, acima disso só se pagam bytes.
+app.config['AI_IMAGE_MAX_EDGE'] = 1024
+app.config['AI_IMAGE_JPEG_QUALITY'] = 85
+# Limites de upload: bytes do pedido e píxeis descodificados (proteção contra decompression bombs)
+app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024
+app.config['MAX_IMAGE_PIXELS'] = 40_000_000
+# Miniaturas servidas por /api/images/<filename>?size=<px> (geradas na primeira leitura)
+app.config['IMAGE_DERIVATIVE_SIZES'] = (128, 512)
+# O gc-uploads só apaga órfãos mais antigos que isto (uploads em curso, receitas por guardar)
+app.config['UPLOAD_GC_MIN_AGE_SECONDS'] = 24 * 60 * 60
+# Os nomes são UUIDs/hashes que nunca mudam: cache imutável de 1 ano no browser.
+# IMAGE_SENDFILE_MODE: None (Flask envia os bytes), 'x-sendfile' (Apache/lighttpd)
+# ou 'x-accel-redirect' (nginx, com location interna em X_ACCEL_REDIRECT_PREFIX)
+app.config['IMAGE_CACHE_MAX_AGE'] = 365 * 24 * 60 * 60
+app.config['IMAGE_SENDFILE_MODE'] = None
+app.config['X_ACCEL_REDIRECT_PREFIX'] = '/protected-uploads'
+
+# Pool de threads para chamadas AI em paralelo e prazo por opção de receita (segundos)
+app.config['AI_EXECUTOR_WORKERS'] = 8
+app.config['BACKGROUND_JOB_WORKERS'] = 4
+# Fila de jobs em SQLite: intervalo de polling dos workers, jobs 'running' sem
+# heartbeat há mais tempo que isto voltam para a fila (worker morreu), intervalo
+# do heartbeat de um job em curso e duração máxima do stream SSE
+app.config['JOB_POLL_INTERVAL_SECONDS'] = 2
+app.config['JOB_STALE_SECONDS'] = 600
+app.config['JOB_HEARTBEAT_SECONDS'] = 60
+app.config['JOB_EVENTS_POLL_SECONDS'] = 0.5
+app.config['JOB_EVENTS_TIMEOUT_SECONDS'] = 180
+app.config['RECIPE_IMAGE_BACKFILL_WORKERS'] = 2
+# Backfill de imagens que falham: tentativas máximas e espera base (dobra a cada falha)
+app.config['RECIPE_IMAGE_MAX_ATTEMPTS'] = 3
+app.config['RECIPE_IMAGE_RETRY_SECONDS'] = 5 * 60
+app.config['RECIPE_OPTION_DEADLINE_SECONDS'] = 45
+# Imagens de receitas (DALL·E): prazo para gerar as de um pedido, qualidade do
+# JPEG guardado e prompts recentes mantidos na cache single-flight
+app.config['RECIPE_IMAGE_DEADLINE_SECONDS'] = 60
+app.config['RECIPE_IMAGE_JPEG_QUALITY'] = 85
+app.config['RECIPE_IMAGE_CACHE_MAX_ENTRIES'] = 256
+# Fotos quase duplicadas (pHash de 64 bits): distância de Hamming máxima e janela
+# em que o resultado AI de uma análise anterior do mesmo utilizador é reaproveitado
+app.config['PHASH_MAX_DISTANCE'] = 6
+app.config['PHASH_REUSE_WINDOW_SECONDS'] = 30 * 60
+# Dentro desta janela a foto quase igual é outra da mesma refeição (rajada): devolve
+# a análise anterior sem gravar outra MealAnalysis nem dar XP
+app.config['PHASH_BURST_WINDOW_SECONDS'] = 2 * 60
+# Análise em lote: imagens por pedido e chamadas GPT-4o em paralelo por lote
+app.config['ANALYSIS_BATCH_MAX_IMAGES'] = 20
+app.config['ANALYSIS_BATCH_CONCURRENCY'] = 4
+
+# Endpoints do Azure OpenAI (podem apontar para o fake_ai_server.py em testes de carga)
+app.config['AZURE_OPENAI_KEY'] = os.environ.get('AZURE_OPENAI_KEY', "DeienCd2CFxMsU08bncNRd3bTlfZ3HgDPyy2R5M9F0OO8vJa9l1EJQQJ99BCACYeBjFXJ3w3AAAAACOG3kpB")
+app.config['AZURE_OPENAI_ENDPOINT'] = os.environ.get('AZURE_OPENAI_ENDPOINT', "https://azure-openai096185143674.openai.azure.com/")
+app.config['AZURE_OPENAI_DEPLOYMENT'] = os.environ.get('AZURE_OPENAI_DEPLOYMENT', "gpt-4o")
+app.config['AZURE_OPENAI_API_VERSION'] = os.environ.get('AZURE_OPENAI_API_VERSION', "2024-12-01-preview")
+app.config['AZURE_DALLE_KEY'] = os.environ.get('AZURE_DALLE_KEY', "ClLQh4NwuGDphJEiuoMCzvjAibamC88Kpi7yNfoliMEpl061SFxqJQQJ99BCACfhMk5XJ3w3AAAAACOGluow")
+app.config['AZURE_DALLE_ENDPOINT'] = os.environ.get('AZURE_DALLE_ENDPOINT', "https://inaop-m8ohnn6q-swedencentral.openai.azure.com")
+app.config['AZURE_DALLE_DEPLOYMENT'] = os.environ.get('AZURE_DALLE_DEPLOYMENT', "dall-e-3")
+app.config['AZURE_DALLE_API_VERSION'] = os.environ.get('AZURE_DALLE_API_VERSION', "2024-02-01")
+
+# Camada de saída para o Azure: pool HTTP, timeouts, retries e circuit breaker
+app.config['AI_HTTP_POOL_SIZE'] = 16
+app.config['AI_CHAT_TIMEOUT_SECONDS'] = 60
+app.config['AI_IMAGE_TIMEOUT_SECONDS'] = 30
+app.config['AI_MAX_RETRIES'] = 2
+app.config['AI_RETRY_BASE_DELAY_SECONDS'] = 0.5
+app.config['AI_RETRY_MAX_DELAY_SECONDS'] = 8
+app.config['AI_UPSTREAM_MAX_CONCURRENCY'] = 8
+app.config['AI_UPSTREAM_QUEUE_TIMEOUT_SECONDS'] = 5
+app.config['AI_BREAKER_FAILURE_THRESHOLD'] = 5
+app.config['AI_BREAKER_RESET_SECONDS'] = 30
+
+# Cache persistente das respostas da AI (TTL em segundos + limite LRU por namespace)
+app.config['AI_CACHE_TTL_SECONDS'] = 7 * 24 * 60 * 60
+app.config['AI_CACHE_MAX_ENTRIES'] = 500
+# Memoização de helpers AI também entre requests (além de dentro do mesmo request)
+app.config['AI_MEMO_CROSS_REQUEST'] = False
 
 # Configurações de sessão (Flask padrão)
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
@@ -63,13 +171,188 @@ db = SQLAlchemy(app)
 # ================================
 if _openai_available:
     client = AzureOpenAI(
-        api_key="DeienCd2CFxMsU08bncNRd3bTlfZ3HgDPyy2R5M9F0OO8vJa9l1EJQQJ99BCACYeBjFXJ3w3AAAAACOG3kpB",
-        api_version="2024-12-01-preview",
-        azure_endpoint="https://azure-openai096185143674.openai.azure.com/"
+        api_key=app.config['AZURE_OPENAI_KEY'],
+        api_version=app.config['AZURE_OPENAI_API_VERSION'],
+        azure_endpoint=app.config['AZURE_OPENAI_ENDPOINT'],
+        # Retries ficam a cargo do UpstreamGuard; o httpx mantém as ligações vivas
+        max_retries=0,
+        timeout=app.config['AI_CHAT_TIMEOUT_SECONDS'],
+        http_client=httpx.Client(limits=httpx.Limits(
+            max_connections=app.config['AI_HTTP_POOL_SIZE'],
+            max_keepalive_connections=app.config['AI_HTTP_POOL_SIZE']
+        ))
     )
 else:  # pragma: no cover - fallback for offline environments
     client = None
 
+# Sessão HTTP partilhada (keep-alive + pool) para o DALL·E e downloads
+ai_http_session = requests.Session()
+ai_http_session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=app.config['AI_HTTP_POOL_SIZE']
+))
+ai_http_session.mount('http://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=app.config['AI_HTTP_POOL_SIZE']
+))
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class UpstreamHTTPError(Exception):
+    """Resposta HTTP com status transitório (429/5xx) de um upstream."""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+        self.status_code = response.status_code
+
+class UpstreamUnavailableError(Exception):
+    """O upstream está com o circuit breaker aberto ou saturado."""
+
+def is_retryable_error(error):
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    transient = (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)
+    if APIConnectionError is not None:
+        transient += (APIConnectionError,)
+    return isinstance(error, transient)
+
+class UpstreamGuard:
+    """
+    Protege um upstream com concorrência limitada, retries com backoff
+    exponencial + jitter em erros transitórios e um circuit breaker.
+
+    Com o breaker aberto as chamadas falham logo com
+    ``UpstreamUnavailableError`` e os helpers caem nos seus fallbacks (mock
+    ou placeholder) em vez de prenderem threads à espera de timeouts. Em
+    half-open passa uma única chamada de teste; as outras continuam a falhar
+    logo até ela terminar.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._semaphore = threading.BoundedSemaphore(app.config['AI_UPSTREAM_MAX_CONCURRENCY'])
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.counters = Counter()
+
+    def _check_breaker(self):
+        """Levanta ``UpstreamUnavailableError`` se a chamada não pode passar;
+        devolve ``True`` se ela é a chamada de teste do half-open."""
+        with self._lock:
+            if self.state == 'closed':
+                return False
+            if self.state == 'open' and time.monotonic() - self.opened_at >= app.config['AI_BREAKER_RESET_SECONDS']:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self.probe_in_flight:
+                self.probe_in_flight = True
+                self.counters['probes'] += 1
+                return True
+            self.counters['short_circuited'] += 1
+            raise UpstreamUnavailableError(f"{self.name}: circuit breaker aberto")
+
+    def _end_probe(self):
+        with self._lock:
+            self.probe_in_flight = False
+
+    def _record_success(self):
+        with self._lock:
+            self.counters['successes'] += 1
+            self.consecutive_failures = 0
+            if self.state != 'closed':
+                logger.info(f"🟢 Upstream {self.name} recuperado - circuit breaker fechado")
+            self.state = 'closed'
+
+    def _record_failure(self):
+        with self._lock:
+            self.counters['failures'] += 1
+            self.consecutive_failures += 1
+            threshold = app.config['AI_BREAKER_FAILURE_THRESHOLD']
+            if self.state == 'half_open' or self.consecutive_failures >= threshold:
+                if self.state != 'open':
+                    logger.warning(f"🔴 Upstream {self.name} instável - circuit breaker aberto")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def _backoff_delay(self, attempt, error):
+        retry_after = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            return min(float(retry_after.get('retry-after')), app.config['AI_RETRY_MAX_DELAY_SECONDS'])
+        except (TypeError, ValueError):
+            pass
+        ceiling = min(
+            app.config['AI_RETRY_MAX_DELAY_SECONDS'],
+            app.config['AI_RETRY_BASE_DELAY_SECONDS'] * (2 ** attempt)
+        )
+        return random.uniform(0, ceiling)
+
+    def call(self, fn):
+        is_probe = self._check_breaker()
+        try:
+            return self._call_with_retries(fn)
+        finally:
+            if is_probe:
+                self._end_probe()
+
+    def _call_with_retries(self, fn):
+        if not self._semaphore.acquire(timeout=app.config['AI_UPSTREAM_QUEUE_TIMEOUT_SECONDS']):
+            with self._lock:
+                self.counters['rejected'] += 1
+            raise UpstreamUnavailableError(f"{self.name}: limite de concorrência atingido")
+        try:
+            attempt = 0
+            while True:
+                with self._lock:
+                    self.counters['calls'] += 1
+                try:
+                    result = fn()
+                except Exception as e:
+                    if not is_retryable_error(e):
+                        raise
+                    self._record_failure()
+                    if attempt >= app.config['AI_MAX_RETRIES'] or self.state == 'open':
+                        raise
+                    delay = self._backoff_delay(attempt, e)
+                    logger.warning(f"↻ {self.name}: erro transitório ({e}); nova tentativa em {delay:.1f}s")
+                    with self._lock:
+                        self.counters['retries'] += 1
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                self._record_success()
+                return result
+        finally:
+            self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                **dict(self.counters)
+            }
+
+chat_upstream = UpstreamGuard('azure_chat')
+image_upstream = UpstreamGuard('azure_dalle')
+
+def create_chat_completion(**kwargs):
+    """Chamada de chat completions (no deployment configurado) protegida pelo
+    ``chat_upstream``."""
+    kwargs.setdefault('model', app.config['AZURE_OPENAI_DEPLOYMENT'])
+    return chat_upstream.call(lambda: client.chat.completions.create(**kwargs))
+
+# Executor partilhado pelas chamadas AI que podem correr em paralelo
+ai_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=app.config['AI_EXECUTOR_WORKERS'],
+    thread_name_prefix='nutrivision-ai'
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -251,44 +534,523 @@ INGREDIENT_TRANSLATIONS = {
     'aceite de oliva': 'olive oil'
 }
 
+# Expressões compostas que não cabem no mapa palavra a palavra acima
+INGREDIENT_PHRASE_TRANSLATIONS = {
+    'peito de frango': 'chicken breast',
+    'pechuga de pollo': 'chicken breast',
+    'coxa de frango': 'chicken thigh',
+    'muslo de pollo': 'chicken thigh',
+    'carne moída': 'ground beef',
+    'carne picada': 'ground beef',
+    'arroz integral': 'brown rice',
+    'batata doce': 'sweet potato',
+    'couve-flor': 'cauliflower',
+    'feijão preto': 'black beans',
+    'frijoles negros': 'black beans',
+    'pimenta preta': 'black pepper',
+    'pimienta negra': 'black pepper',
+    'sementes de chia': 'chia seeds',
+    'semillas de chía': 'chia seeds',
+    'óleo de coco': 'coconut oil',
+    'aceite de coco': 'coconut oil',
+    'iogurte grego': 'greek yogurt',
+    'yogur griego': 'greek yogurt',
+    'sal': 'salt',
+    'alface': 'lettuce',
+    'lechuga': 'lettuce',
+    'pepino': 'cucumber',
+    'milho': 'corn',
+    'maíz': 'corn',
+    'ervilhas': 'peas',
+    'guisantes': 'peas',
+    'amêndoas': 'almonds',
+    'almendras': 'almonds',
+    'nozes': 'walnuts',
+    'nueces': 'walnuts',
+    'canela': 'cinnamon',
+    'gengibre': 'ginger',
+    'jengibre': 'ginger',
+}
 
-def translate_ingredients_to_english(ingredients_list):
-    """
-    Traduz ingredientes (PT/ES → EN) para o AI processar melhor
-    """
-    translated = []
-    for ingredient in ingredients_list:
-        ingredient_lower = ingredient.lower().strip()
-        if ingredient_lower in INGREDIENT_TRANSLATIONS:
-            translated.append(INGREDIENT_TRANSLATIONS[ingredient_lower])
-        else:
-            translated.append(ingredient)
-    return translated
+# Modificadores de preparação: traduzidos e colocados antes do nome ("frango grelhado" → "grilled chicken")
+INGREDIENT_MODIFIER_TRANSLATIONS = {
+    'grilled': ['grelhado', 'grelhada', 'a la plancha'],
+    'roasted': ['assado', 'assada', 'asado', 'asada'],
+    'boiled': ['cozido', 'cozida', 'cocido', 'cocida', 'hervido', 'hervida'],
+    'fried': ['frito', 'frita'],
+    'raw': ['cru', 'crua', 'crudo', 'cruda'],
+    'chopped': ['picado', 'picada'],
+    'grated': ['ralado', 'ralada', 'rallado', 'rallada'],
+    'fresh': ['fresco', 'fresca'],
+    'smoked': ['fumado', 'fumada', 'defumado', 'defumada', 'ahumado', 'ahumada'],
+    'frozen': ['congelado', 'congelada'],
+    'lean': ['magro', 'magra'],
+    'skimmed': ['desnatado', 'desnatada'],
+}
+
+# Palavras que ligam ingredientes: 'de'/'of' desaparecem, 'com'/'e' separam partes
+INGREDIENT_CONNECTORS = {
+    'de': None, 'do': None, 'da': None, 'dos': None, 'das': None, 'del': None, 'of': None,
+    'com': 'with', 'con': 'with', 'with': 'with',
+    'e': 'and', 'y': 'and', 'and': 'and',
+}
+
+# Palavras que nunca são comida (EN/PT/ES): decidem localmente sem perguntar ao GPT
+NON_FOOD_LEXICON = [
+    # Eletrónica
+    'phone', 'iphone', 'smartphone', 'telemovel', 'celular', 'telefono', 'laptop', 'computer',
+    'computador', 'ordenador', 'charger', 'carregador', 'cargador', 'cable', 'cabo', 'battery',
+    'bateria', 'tv', 'television', 'televisao', 'remote', 'comando', 'headphones', 'auscultadores',
+    'auriculares', 'keyboard', 'teclado', 'mouse', 'rato', 'camera', 'tablet', 'console',
+    # Casa e mobília
+    'chair', 'cadeira', 'silla', 'table', 'mesa', 'sofa', 'bed', 'cama', 'lamp', 'candeeiro',
+    'lampara', 'door', 'porta', 'puerta', 'window', 'janela', 'ventana', 'pillow', 'almofada',
+    'almohada', 'blanket', 'cobertor', 'manta', 'towel', 'toalha', 'toalla', 'curtain', 'cortina',
+    # Utensílios e materiais
+    'plate', 'prato', 'plato', 'fork', 'garfo', 'tenedor', 'knife', 'faca', 'cuchillo', 'spoon',
+    'caneca', 'napkin', 'guardanapo', 'servilleta', 'plastic',
+    'plastico', 'paper', 'papel', 'cardboard', 'cartao', 'carton', 'glass', 'vidro', 'vidrio',
+    'metal', 'wood', 'madeira', 'madera', 'stone', 'pedra', 'piedra', 'sand', 'areia', 'arena',
+    'rock', 'brick', 'tijolo', 'ladrillo', 'cement', 'cimento', 'cemento',
+    # Roupa e objetos pessoais
+    'shirt', 'camisa', 'camisola', 'pants', 'calcas', 'pantalones', 'shoe', 'sapato', 'zapato',
+    'sock', 'calcetin', 'hat', 'chapeu', 'sombrero', 'bag', 'mala', 'bolsa', 'wallet',
+    'carteira', 'cartera', 'key', 'chave', 'llave', 'watch', 'relogio', 'reloj', 'pen', 'caneta',
+    'boligrafo', 'pencil', 'lapis', 'lapiz', 'book', 'livro', 'libro', 'notebook', 'caderno',
+    'cuaderno', 'toy', 'brinquedo', 'juguete', 'ball', 'bola', 'pelota',
+    # Higiene, limpeza e químicos
+    'soap', 'sabao', 'sabonete', 'jabon', 'shampoo', 'champo', 'toothpaste', 'detergent',
+    'detergente', 'bleach', 'lixivia', 'lejia', 'perfume', 'deodorant', 'desodorizante',
+    'desodorante', 'medicine', 'medicamento', 'pill', 'comprimido', 'pastilla', 'gasoline',
+    'gasolina', 'diesel', 'paint', 'tinta', 'pintura', 'glue', 'pegamento',
+    # Outros
+    'car', 'carro', 'coche', 'bicycle', 'bicicleta', 'money', 'dinheiro', 'dinero', 'coin',
+    'moeda', 'moneda', 'dog', 'cao', 'perro', 'cat', 'gato', 'plant', 'planta', 'flower',
+    'flor', 'tree', 'arvore', 'arbol', 'grass', 'relva', 'cesped', 'dirt', 'terra', 'tierra',
+]
+
+# Quantidades no início do texto: "2 ovos", "200g de arroz", "meia chávena de aveia"
+QUANTITY_NUMBER_PATTERN = re.compile(r'^\s*(\d+\s+\d+/\d+|\d+(?:[.,]\d+)?(?:/\d+)?|[½¼¾⅓⅔])\s*')
+QUANTITY_FRACTIONS = {'½': 0.5, '¼': 0.25, '¾': 0.75, '⅓': 1 / 3, '⅔': 2 / 3}
+QUANTITY_WORDS = {
+    'um': 1, 'uma': 1, 'uno': 1, 'una': 1, 'one': 1, 'a': 1, 'an': 1,
+    'dois': 2, 'duas': 2, 'dos': 2, 'two': 2,
+    'tres': 3, 'three': 3, 'quatro': 4, 'cuatro': 4, 'four': 4,
+    'cinco': 5, 'five': 5, 'seis': 6, 'six': 6,
+    'meio': 0.5, 'meia': 0.5, 'medio': 0.5, 'media': 0.5, 'half': 0.5,
+}
+QUANTITY_UNITS = {
+    'g': ['g', 'gr', 'gram', 'grams', 'grama', 'gramas', 'gramo', 'gramos'],
+    'kg': ['kg', 'kilo', 'kilos', 'quilo', 'quilos', 'kilogram', 'kilograms'],
+    'ml': ['ml', 'mililitro', 'mililitros', 'milliliter', 'milliliters'],
+    'l': ['l', 'litro', 'litros', 'liter', 'liters', 'litre', 'litres'],
+    'oz': ['oz', 'ounce', 'ounces'],
+    'lb': ['lb', 'lbs', 'pound', 'pounds'],
+    'cup': ['cup', 'cups', 'chavena', 'chavenas', 'xicara', 'xicaras', 'taza', 'tazas', 'copo', 'copos', 'vaso', 'vasos', 'glass', 'glasses'],
+    'tbsp': ['tbsp', 'tablespoon', 'tablespoons', 'colher', 'colheres', 'cucharada', 'cucharadas'],
+    'tsp': ['tsp', 'teaspoon', 'teaspoons', 'colherzinha', 'cucharadita', 'cucharaditas'],
+    'slice': ['slice', 'slices', 'fatia', 'fatias', 'rebanada', 'rebanadas', 'rodaja', 'rodajas'],
+    'piece': ['piece', 'pieces', 'pedaco', 'pedacos', 'trozo', 'trozos', 'unidade', 'unidades', 'unidad', 'unidades'],
+    'clove': ['clove', 'cloves', 'dente', 'dentes', 'diente', 'dientes'],
+    'can': ['can', 'cans', 'lata', 'latas'],
+    'handful': ['handful', 'handfuls', 'punhado', 'punhados', 'punado', 'punados'],
+}
+QUANTITY_UNIT_ALIASES = {alias: unit for unit, aliases in QUANTITY_UNITS.items() for alias in aliases}
+# "colher de sopa" é uma colher de sopa, "colher de chá" uma de chá
+QUANTITY_UNIT_QUALIFIERS = re.compile(r'^(?:de|of)\s+(sopa|cha|postre|cafe|sobremesa)\b\s*')
+QUANTITY_SMALL_SPOON_QUALIFIERS = {'cha', 'cafe', 'postre', 'sobremesa'}
 
 # Achata todas as opções válidas de ingredientes
 ALL_VALID_INGREDIENTS = []
 for category in VALID_FOOD_CATEGORIES.values():
     ALL_VALID_INGREDIENTS.extend(category)
 
-def find_similar_ingredients(ingredient):
+# Plurais PT/ES/EN → forma comum (a primeira regra que casar ganha). Não é
+# linguisticamente exato: só precisa de levar singular e plural à mesma chave.
+PLURAL_STEM_RULES = (
+    ('oes', 'o'),   # limões/limão, tomatoes/tomato
+    ('aes', 'o'),   # pães/pão (palavras curtas ficam em "-ao", ver stem_ingredient_token)
+    ('ao', 'o'),
+    ('ies', 'y'),   # berries/berry
+    ('ais', 'al'),  # cereais/cereal
+    ('eis', 'el'),  # pastéis/pastel
+)
+
+def fold_accents(text):
+    return ''.join(
+        char for char in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(char)
+    )
+
+def stem_ingredient_token(token):
+    if len(token) < 3:
+        return token
+    for suffix, replacement in PLURAL_STEM_RULES:
+        if token.endswith(suffix):
+            stem = token[:-len(suffix)] + replacement
+            # "pão"/"grão" não encolhem para "po"/"gro", que aparecem dentro de tudo
+            if suffix in ('ao', 'aes') and len(stem) < 4:
+                stem = token[:-len(suffix)] + 'ao'
+            return stem
+    if token.endswith('s') and not token.endswith(('ss', 'us')):
+        token = token[:-1]
+    if len(token) > 3 and token.endswith('e'):
+        token = token[:-1]  # tomate/tomates, cheese/cheeses
+    if len(token) > 3 and token.endswith('m'):
+        token = token[:-1] + 'n'  # amendoim/amendoins
+    return token
+
+@functools.lru_cache(maxsize=4096)
+def normalize_ingredient(text):
+    """Casefold, sem acentos nem pontuação e com cada palavra no singular."""
+    text = re.sub(r'[^a-z0-9]+', ' ', fold_accents(text.casefold()))
+    return ' '.join(stem_ingredient_token(token) for token in text.split())
+
+class IngredientIndex:
     """
-    Retorna até 3 ingredientes similares, usando interseção de palavras
+    Índice pré-calculado sobre uma lista de ingredientes (com a ordem e os
+    duplicados da lista original), para validar e sugerir sem percorrer
+    a lista inteira por cada input:
+
+    - ``names``: conjunto de nomes (match exato e "nome contido no input");
+    - ``substrings``: todas as substrings dos nomes ("input contido no nome");
+    - ``tokens``: palavra → posições dos nomes que a contêm;
+    - ``prefixes``: prefixo → posições dos nomes que começam por ele;
+    - ``trigrams``: trigrama → chaves distintas, para sugestões ordenadas.
+
+    Com ``normalize`` as estruturas são construídas sobre as chaves
+    normalizadas e o input passa pela mesma função antes de cada consulta.
+    Com ``whole_words`` um nome só conta como contido no input se ocupar
+    palavras inteiras (as chaves normalizadas são curtas: "pao" em "tipo").
     """
-    similar = []
-    ingredient_words = set(ingredient.split())
 
-    for valid_ingredient in ALL_VALID_INGREDIENTS:
-        valid_words = set(valid_ingredient.split())
-        if ingredient_words & valid_words:
-            similar.append(valid_ingredient)
-        elif any(valid_ingredient.startswith(word) for word in ingredient_words):
-            similar.append(valid_ingredient)
+    def __init__(self, entries, normalize=None, whole_words=False):
+        self.entries = list(entries)
+        self.normalize = normalize or (lambda text: text)
+        self.whole_words = whole_words
+        self.keys = [self.normalize(name) for name in self.entries]
+        self.names = set(self.keys)
+        self.name_lengths = sorted({len(name) for name in self.names})
+        self.substrings = {''} if self.entries else set()
+        self.tokens = {}
+        self.prefixes = {}
+        for position, name in enumerate(self.keys):
+            for start in range(len(name)):
+                for stop in range(start + 1, len(name) + 1):
+                    self.substrings.add(name[start:stop])
+            for token in set(name.split()):
+                self.tokens.setdefault(token, []).append(position)
+            for stop in range(1, len(name) + 1):
+                self.prefixes.setdefault(name[:stop], []).append(position)
+
+        # Sugestões ordenadas: uma entrada por chave distinta (o primeiro nome da lista)
+        self.ranked_keys = []
+        self.ranked_names = []
+        self.key_trigrams = []
+        self.trigrams = {}
+        seen_keys = set()
+        for name, key in zip(self.entries, self.keys):
+            if key in seen_keys:
+                continue
+            seen_keys.add(key)
+            key_id = len(self.ranked_keys)
+            grams = self.trigram_set(key)
+            self.ranked_keys.append(key)
+            self.ranked_names.append(name)
+            self.key_trigrams.append(len(grams))
+            for gram in grams:
+                self.trigrams.setdefault(gram, []).append(key_id)
+
+    @staticmethod
+    def trigram_set(text):
+        padded = f"  {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def contains_name(self, text):
+        """Algum nome da lista é substring de ``text``?"""
+        if self.whole_words:
+            words = text.split()
+            return any(
+                ' '.join(words[start:stop]) in self.names
+                for start in range(len(words))
+                for stop in range(start + 1, len(words) + 1)
+            )
+        for length in self.name_lengths:
+            if length > len(text):
+                break
+            for start in range(len(text) - length + 1):
+                if text[start:start + length] in self.names:
+                    return True
+        return False
+
+    def matches(self, text):
+        """Mesma regra do scan linear: input contido num nome, nome contido no
+        input, ou pelo menos uma palavra em comum."""
+        text = self.normalize(text)
+        if not text:
+            return False
+        return (
+            text in self.substrings
+            or self.contains_name(text)
+            or any(token in self.tokens for token in text.split())
+        )
+
+    def similar(self, text, limit=3):
+        """Nomes com uma palavra em comum ou que começam por uma palavra do
+        input, pela ordem da lista original."""
+        text = self.normalize(text)
+        positions = set()
+        for word in set(text.split()):
+            positions.update(self.tokens.get(word, ()))
+            positions.update(self.prefixes.get(word, ()))
+        return [self.entries[position] for position in sorted(positions)[:limit]]
+
+    def ranked(self, text, limit=5, min_score=0.0):
+        """Top-``limit`` nomes por semelhança de trigramas (coeficiente de Dice)."""
+        grams = self.trigram_set(self.normalize(text))
+        shared = Counter()
+        for gram in grams:
+            for key_id in self.trigrams.get(gram, ()):
+                shared[key_id] += 1
+        scored = []
+        for key_id, count in shared.items():
+            score = 2 * count / (len(grams) + self.key_trigrams[key_id])
+            if score >= min_score:
+                scored.append((-score, key_id))
+        scored.sort()
+        return [
+            {'name': self.ranked_names[key_id], 'score': round(-score, 3)}
+            for score, key_id in scored[:limit]
+        ]
+
+INGREDIENT_INDEX = IngredientIndex(ALL_VALID_INGREDIENTS)
+# Mesma lista sem acentos/maiúsculas/plurais: "tomate", "brocolos", "egg"...
+NORMALIZED_INGREDIENT_INDEX = IngredientIndex(ALL_VALID_INGREDIENTS, normalize=normalize_ingredient, whole_words=True)
+
+# Semelhança mínima (Dice de trigramas) para uma sugestão ser devolvida
+INGREDIENT_SUGGESTION_MIN_SCORE = 0.35
 
-    return similar[:3]
+# ================================
+# 📚 VOCABULÁRIO ALIMENTAR (embutido ou SQLite externo)
+# ================================
+class FoodVocabulary(ABC):
+    """
+    Interface comum de validação e sugestões. Todas as chaves são as de
+    ``normalize_ingredient``.
+
+    - ``matches(text)``: o texto é (ou contém / partilha uma palavra com) um alimento;
+    - ``known_names(keys)``: as chaves que são nomes de alimentos;
+    - ``ranked(text, limit, min_score)``: ``[{'name', 'score'}]`` por semelhança.
+    """
+
+    @abstractmethod
+    def matches(self, text):
+        ...
+
+    @abstractmethod
+    def known_names(self, keys):
+        ...
+
+    @abstractmethod
+    def ranked(self, text, limit=5, min_score=0.0):
+        ...
+
+class BuiltinFoodVocabulary(FoodVocabulary):
+    """VALID_FOOD_CATEGORIES através dos índices em memória."""
+
+    def matches(self, text):
+        return INGREDIENT_INDEX.matches(text) or NORMALIZED_INGREDIENT_INDEX.matches(text)
+
+    def known_names(self, keys):
+        return {key for key in keys if key in NORMALIZED_INGREDIENT_INDEX.names}
+
+    def ranked(self, text, limit=5, min_score=0.0):
+        return NORMALIZED_INGREDIENT_INDEX.ranked(text, limit=limit, min_score=min_score)
+
+class SQLiteFoodVocabulary(FoodVocabulary):
+    """
+    Vocabulário grande num ficheiro SQLite só de leitura, consultado por SQL
+    sem carregar as entradas para memória. Tabelas:
+
+    - ``foods``: nome, chave normalizada, categoria, língua, nome canónico e nº de trigramas;
+    - ``food_tokens``: palavra → alimento;
+    - ``food_trigrams``: trigrama → alimento (sugestões por coeficiente de Dice).
+
+    ``matches`` só usa consultas indexadas: sequências de palavras do input
+    (até ``MAX_NAME_TOKENS``) que são nomes, palavras em comum e o input como
+    prefixo de um nome (intervalo em ``ix_foods_normalized``). Ao contrário do
+    vocabulário embutido, substrings a meio de uma palavra ("icke",
+    "chickenbreast") não contam: isso obrigava a percorrer a tabela inteira.
+    """
+    MAX_NAME_TOKENS = 5
+    MAX_CANDIDATES = 200
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _placeholders(values):
+        return ', '.join('?' for _ in values)
+
+    def known_names(self, keys):
+        keys = [key for key in keys if key]
+        if not keys:
+            return set()
+        rows = self._connection().execute(
+            f"SELECT DISTINCT normalized FROM foods WHERE normalized IN ({self._placeholders(keys)})", keys
+        )
+        return {row[0] for row in rows}
+
+    def matches(self, text):
+        key = normalize_ingredient(text)
+        tokens = key.split()
+        if not tokens:
+            return False
+        spans = {
+            ' '.join(tokens[start:stop])
+            for start in range(len(tokens))
+            for stop in range(start + 1, min(len(tokens), start + self.MAX_NAME_TOKENS) + 1)
+        }
+        if self.known_names(spans):
+            return True
+        if self._connection().execute(
+            f"SELECT 1 FROM food_tokens WHERE token IN ({self._placeholders(tokens)}) LIMIT 1", tokens
+        ).fetchone() is not None:
+            return True
+        # Prefixo com e sem singular ("parmes" → "parm"); as chaves são ASCII,
+        # por isso prefix + U+FFFF fecha o intervalo dos nomes que começam por prefix
+        folded = ' '.join(re.sub(r'[^a-z0-9]+', ' ', fold_accents(text.casefold())).split())
+        return any(
+            self._connection().execute(
+                "SELECT 1 FROM foods WHERE normalized >= ? AND normalized < ? LIMIT 1",
+                (prefix, prefix + '\uffff')
+            ).fetchone() is not None
+            for prefix in dict.fromkeys((key, folded)) if prefix
+        )
+
+    def ranked(self, text, limit=5, min_score=0.0):
+        grams = sorted(IngredientIndex.trigram_set(normalize_ingredient(text)))
+        rows = self._connection().execute(
+            f"""SELECT f.name, f.canonical, f.gram_count, COUNT(*) AS shared
+                FROM food_trigrams t JOIN foods f ON f.id = t.food_id
+                WHERE t.gram IN ({self._placeholders(grams)})
+                GROUP BY t.food_id ORDER BY shared DESC LIMIT ?""",
+            grams + [self.MAX_CANDIDATES]
+        )
+        best = {}
+        for name, canonical, gram_count, shared in rows:
+            score = 2 * shared / (len(grams) + gram_count)
+            if score >= min_score and score > best.get(name, -1):
+                best[name] = score
+        ranked = sorted(best.items(), key=lambda item: (-item[1], item[0]))
+        return [{'name': name, 'score': round(score, 3)} for name, score in ranked[:limit]]
+
+_food_vocabulary = None
+_food_vocabulary_lock = threading.Lock()
+
+def get_food_vocabulary():
+    """Abre o vocabulário na primeira utilização: o SQLite configurado, se existir."""
+    global _food_vocabulary
+    if _food_vocabulary is None:
+        with _food_vocabulary_lock:
+            if _food_vocabulary is None:
+                path = app.config['FOOD_VOCABULARY_PATH']
+                if path and os.path.exists(path):
+                    logger.info(f"📚 Vocabulário alimentar externo: {path}")
+                    _food_vocabulary = SQLiteFoodVocabulary(path)
+                else:
+                    _food_vocabulary = BuiltinFoodVocabulary()
+    return _food_vocabulary
+
+def builtin_food_vocabulary_records():
+    """Entradas do vocabulário embutido no formato do build (categorias + traduções)."""
+    translations = {**INGREDIENT_TRANSLATIONS, **INGREDIENT_PHRASE_TRANSLATIONS}
+    for category, names in VALID_FOOD_CATEGORIES.items():
+        for name in names:
+            yield {'name': name, 'category': category, 'canonical': translations.get(name, '')}
+    for name, english in translations.items():
+        yield {'name': name, 'canonical': english}
+
+def read_food_vocabulary_source(path):
+    """Lê um CSV (cabeçalho name,category,language,synonyms,canonical) ou JSONL."""
+    with open(path, encoding='utf-8') as fh:
+        if path.endswith('.jsonl'):
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(fh)
+
+def build_food_vocabulary(records, output_path):
+    """Gera o ficheiro SQLite do vocabulário (escrita atómica). Devolve o nº de nomes."""
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript("""
+            CREATE TABLE foods (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                category TEXT,
+                language TEXT,
+                canonical TEXT,
+                gram_count INTEGER NOT NULL
+            );
+            CREATE TABLE food_tokens (token TEXT NOT NULL, food_id INTEGER NOT NULL, PRIMARY KEY (token, food_id)) WITHOUT ROWID;
+            CREATE TABLE food_trigrams (gram TEXT NOT NULL, food_id INTEGER NOT NULL, PRIMARY KEY (gram, food_id)) WITHOUT ROWID;
+        """)
+        seen = set()
+        count = 0
+        for record in records:
+            synonyms = record.get('synonyms') or []
+            if isinstance(synonyms, str):
+                synonyms = [synonym for synonym in synonyms.split('|') if synonym.strip()]
+            canonical = (record.get('canonical') or '').strip() or None
+            for name in [record.get('name', '')] + list(synonyms):
+                name = name.strip()
+                normalized = normalize_ingredient(name)
+                if not normalized or normalized in seen:
+                    continue
+                seen.add(normalized)
+                grams = IngredientIndex.trigram_set(normalized)
+                food_id = conn.execute(
+                    "INSERT INTO foods (name, normalized, category, language, canonical, gram_count) VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, normalized, record.get('category'), record.get('language'), canonical, len(grams))
+                ).lastrowid
+                conn.executemany("INSERT OR IGNORE INTO food_tokens VALUES (?, ?)", [(token, food_id) for token in set(normalized.split())])
+                conn.executemany("INSERT OR IGNORE INTO food_trigrams VALUES (?, ?)", [(gram, food_id) for gram in grams])
+                count += 1
+        conn.execute("CREATE INDEX ix_foods_normalized ON foods (normalized)")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, output_path)
+    return count
+
+def rank_similar_ingredients(ingredient, limit=5):
+    """Sugestões ``[{'name', 'score'}]`` ordenadas da mais para a menos parecida."""
+    return get_food_vocabulary().ranked(ingredient, limit=limit, min_score=INGREDIENT_SUGGESTION_MIN_SCORE)
+
+def find_similar_ingredients(ingredient, limit=3):
+    """
+    Retorna até 3 ingredientes similares, os mais parecidos primeiro
+    """
+    return [match['name'] for match in rank_similar_ingredients(ingredient, limit=limit)]
 
 def validate_ingredients(ingredients_list, strict=True):
     """
-    Valida os ingredientes utilizando o dicionário interno.
+    Valida os ingredientes utilizando o vocabulário alimentar (``get_food_vocabulary``).
+
+    Um item é válido se casar com o dicionário tal como foi escrito ou depois
+    de normalizado (sem acentos, maiúsculas nem plurais).
 
     Se ``strict`` for ``False`` todos os itens são considerados válidos e
     apenas sugestões de possíveis correções são retornadas.
@@ -296,40 +1058,243 @@ def validate_ingredients(ingredients_list, strict=True):
     valid_items = []
     invalid_items = []
     suggestions = []
+    ranked_suggestions = []
 
     for ingredient in ingredients_list:
-        ingredient_clean = ingredient.lower().strip()
-        is_valid = False
-        for valid_ingredient in ALL_VALID_INGREDIENTS:
-            if (
-                ingredient_clean in valid_ingredient
-                or valid_ingredient in ingredient_clean
-                or len(set(ingredient_clean.split()) & set(valid_ingredient.split())) > 0
-            ):
-                is_valid = True
-                break
+        # Mesma forma canónica que a tradução: sem quantidade e em inglês quando possível
+        ingredient_clean = translate_ingredient(ingredient.strip())['name'].lower().strip()
+        vocabulary = get_food_vocabulary()
+        is_valid = any(vocabulary.matches(text) for text in {ingredient_clean, ingredient.lower().strip()})
 
         if is_valid or not strict:
             valid_items.append(ingredient)
         else:
             invalid_items.append(ingredient)
 
-        similar = find_similar_ingredients(ingredient_clean)
-        if similar:
-            suggestions.extend(similar[:2])
+        ranked = rank_similar_ingredients(ingredient_clean, limit=3)
+        if ranked:
+            suggestions.extend(match['name'] for match in ranked[:2])
+            ranked_suggestions.append({'input': ingredient, 'suggestions': ranked})
 
     return {
         'valid_items': valid_items,
         'invalid_items': invalid_items if strict else [],
-        'suggestions': list(set(suggestions))
+        'suggestions': list(dict.fromkeys(suggestions)),
+        'ranked_suggestions': ranked_suggestions
     }
 
+# ================================
+# 🌍 TRADUÇÃO COMPILADA DE INGREDIENTES
+# ================================
+def parse_quantity_number(text):
+    text = text.strip()
+    if text in QUANTITY_FRACTIONS:
+        return QUANTITY_FRACTIONS[text]
+    if ' ' in text:
+        whole, fraction = text.split(None, 1)
+        fraction = parse_quantity_number(fraction)
+        # "1 1/0": a fração inválida invalida o número todo
+        return None if fraction is None else float(whole) + fraction
+    if '/' in text:
+        numerator, denominator = text.split('/')
+        return float(numerator) / float(denominator) if float(denominator) else None
+    return float(text.replace(',', '.'))
+
+def parse_ingredient_quantity(text):
+    """
+    Separa a quantidade e a unidade do início do texto.
+
+    ``"200g de arroz"`` → ``(200.0, 'g', 'arroz')``; ``"2 ovos"`` →
+    ``(2.0, None, 'ovos')``; sem quantidade → ``(None, None, text)``.
+    """
+    rest = text.strip()
+    quantity = None
+    match = QUANTITY_NUMBER_PATTERN.match(rest)
+    if match:
+        quantity = parse_quantity_number(match.group(1))
+        rest = rest[match.end():]
+    else:
+        first, _, tail = rest.partition(' ')
+        word = fold_accents(first.casefold())
+        if word in QUANTITY_WORDS and tail.strip():
+            quantity = float(QUANTITY_WORDS[word])
+            rest = tail
+
+    unit = None
+    if quantity is not None:
+        first, _, tail = rest.strip().partition(' ')
+        alias = fold_accents(first.casefold()).rstrip('.')
+        if alias in QUANTITY_UNIT_ALIASES:
+            unit = QUANTITY_UNIT_ALIASES[alias]
+            rest = tail
+            qualifier = QUANTITY_UNIT_QUALIFIERS.match(fold_accents(rest.strip().casefold()))
+            if qualifier:
+                if unit == 'tbsp' and qualifier.group(1) in QUANTITY_SMALL_SPOON_QUALIFIERS:
+                    unit = 'tsp'
+                rest = rest.strip()[qualifier.end():]
+
+    rest = re.sub(r'^(?:de|do|da|dos|das|del|of)\s+', '', rest.strip(), flags=re.IGNORECASE)
+    return quantity, unit, rest
+
+class PhraseTranslator:
+    """
+    Trie de palavras normalizadas (sem acentos, no singular) → tradução
+    inglesa de um nome ou de um modificador. Cada texto é percorrido uma vez
+    com longest-match, por isso "peito de frango" ganha a "frango" e
+    "carne picada" a "picada".
+    """
+    TERMINAL = object()
+
+    def __init__(self, phrases, modifiers, connectors):
+        self.root = {}
+        for phrase, english in phrases.items():
+            self._add(phrase, ('noun', english))
+        for english, aliases in modifiers.items():
+            for alias in aliases:
+                self._add(alias, ('modifier', english))
+        self.connectors = {normalize_ingredient(word): value for word, value in connectors.items()}
+
+    def _add(self, phrase, value):
+        node = self.root
+        for token in normalize_ingredient(phrase).split():
+            node = node.setdefault(token, {})
+        node.setdefault(self.TERMINAL, value)
+
+    def longest_match(self, keys, start):
+        node = self.root
+        best = None
+        for position in range(start, len(keys)):
+            node = node.get(keys[position])
+            if node is None:
+                break
+            if self.TERMINAL in node:
+                best = (node[self.TERMINAL], position + 1)
+        return best
+
+    def translate(self, text):
+        """
+        Devolve ``(nome em inglês, traduziu)``. Se alguma palavra ficar por
+        traduzir devolve ``(text, False)``: "leite de coco" não vira "milk coco".
+        """
+        words = re.findall(r'\w+', text.casefold())
+        keys = [normalize_ingredient(word) for word in words]
+        segments = [{'modifiers': [], 'nouns': [], 'joiner': None}]
+        translated = False
+        position = 0
+        while position < len(keys):
+            match = self.longest_match(keys, position)
+            if match:
+                (kind, english), position = match
+                segments[-1]['modifiers' if kind == 'modifier' else 'nouns'].append(english)
+                translated = True
+                continue
+            key = keys[position]
+            if key in self.connectors:
+                joiner = self.connectors[key]
+                if joiner and segments[-1]['nouns']:
+                    segments.append({'modifiers': [], 'nouns': [], 'joiner': joiner})
+            elif key:
+                return text.strip(), False
+            position += 1
+
+        parts = []
+        for segment in segments:
+            if not segment['nouns'] and not segment['modifiers']:
+                continue
+            if segment['joiner'] and parts:
+                parts.append(segment['joiner'])
+            parts.extend(segment['modifiers'] + segment['nouns'])
+        return ' '.join(parts), translated
+
+INGREDIENT_TRANSLATOR = PhraseTranslator(
+    {**INGREDIENT_TRANSLATIONS, **INGREDIENT_PHRASE_TRANSLATIONS},
+    INGREDIENT_MODIFIER_TRANSLATIONS,
+    INGREDIENT_CONNECTORS
+)
+
+@functools.lru_cache(maxsize=4096)
+def translate_ingredient(ingredient):
+    """
+    Forma canónica de um ingrediente: nome em inglês sem quantidade, mais a
+    quantidade/unidade lidas do texto. Itens sem nada para traduzir nem
+    quantidade mantêm o texto original.
+    """
+    quantity, unit, rest = parse_ingredient_quantity(ingredient)
+    english, translated = INGREDIENT_TRANSLATOR.translate(rest)
+    if translated:
+        name = english
+    elif quantity is not None:
+        name = rest
+    else:
+        name = ingredient
+    if not name.strip():
+        # Só quantidade ("2", "½"): fica o texto original, que não valida como comida
+        name = ingredient
+    return {
+        'original': ingredient,
+        'name': name,
+        'quantity': quantity,
+        'unit': unit
+    }
+
+def translate_ingredients_to_english(ingredients_list):
+    """
+    Traduz ingredientes (PT/ES → EN) para o AI processar melhor
+    """
+    return [translate_ingredient(ingredient)['name'] for ingredient in ingredients_list]
+
+# ================================
+# 🧠 MEMOIZAÇÃO DE CHAMADAS AI
+# ================================
+def memoize_ai_call(namespace):
+    """
+    Memoiza um helper AI por argumentos idênticos.
+
+    Dentro do mesmo request o resultado fica em ``flask.g``; com
+    ``AI_MEMO_CROSS_REQUEST`` ativo, resultados não vazios também são
+    guardados no cache persistente ``namespace``.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = AI_CACHES[namespace]
+            key = AIResponseCache.make_key(func.__name__, args, kwargs)
+
+            request_memo = None
+            if has_app_context():
+                request_memo = g.setdefault('ai_memo', {})
+                if key in request_memo:
+                    cache.record_request_hit()
+                    return request_memo[key]
+
+            cross_request = has_app_context() and app.config['AI_MEMO_CROSS_REQUEST']
+            if cross_request:
+                cached = cache.get(key)
+                if cached is not None:
+                    result = json.loads(cached)
+                    request_memo[key] = result
+                    return result
+
+            result = func(*args, **kwargs)
+            if request_memo is not None:
+                request_memo[key] = result
+            if cross_request and result:
+                cache.set(key, json.dumps(result))
+            return result
+        return wrapper
+    return decorator
+
 # ================================
 # 🎨 IMAGE-TO-INGREDIENT DETECTION HELPER
 # ================================
-def detect_ingredients_from_image(image_base64):
+def jpeg_data_url(image_bytes):
+    """URL ``data:`` dos bytes JPEG, gerado só quando a imagem vai mesmo ao GPT-4o."""
+    return 'data:image/jpeg;base64,' + base64.b64encode(image_bytes).decode('ascii')
+
+@memoize_ai_call('ingredient_detection')
+def detect_ingredients_from_image(image_bytes):
     """
-    Envia a imagem (em base64) ao GPT-4o pedindo para listar
+    Envia a imagem (bytes JPEG) ao GPT-4o pedindo para listar
     os ingredientes/alimentos que aparecem. Retorna uma lista de strings.
     """
     system_prompt = """
@@ -350,15 +1315,14 @@ def detect_ingredients_from_image(image_base64):
         return []
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = create_chat_completion(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {
                     "role": "user",
                     "content": [
                         {"type": "text", "text": "Detecte todos os alimentos nesta imagem e retorne um JSON array com os nomes."},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                        {"type": "image_url", "image_url": {"url": jpeg_data_url(image_bytes)}}
                     ]
                 }
             ],
@@ -386,11 +1350,11 @@ def detect_ingredients_from_image(image_base64):
     return []
 
 
-def is_food_image(image_base64):
+def is_food_image(image_bytes):
     """
     Retorna True se houver pelo menos um item alimentar detectado pela AI.
     """
-    detected_items = detect_ingredients_from_image(image_base64)
+    detected_items = detect_ingredients_from_image(image_bytes)
     return bool(detected_items)
 
 # ================================
@@ -468,6 +1432,7 @@ class MealAnalysis(db.Model):
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     meal_type = db.Column(db.String(20))
+    image_phash = db.Column(db.String(16), index=True)  # pHash hex da foto (deteção de duplicados)
 
 class DailyMeal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -617,6 +1582,9 @@ class RecipeCollection(db.Model):
     matches_dna = db.Column(db.Boolean, default=False)
     personalization_score = db.Column(db.Float, default=0.0)
     image_url = db.Column(db.String(300), nullable=True)  # ← ADICIONADO para armazenar URL de foto
+    # Falhas do backfill de imagem: nº de tentativas e quando foi a última
+    image_attempts = db.Column(db.Integer, nullable=False, default=0)
+    image_failed_at = db.Column(db.DateTime, nullable=True)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -643,6 +1611,44 @@ class RecipeCollection(db.Model):
             "created_at": self.created_at.isoformat()
         }
 
+class AICacheEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    namespace = db.Column(db.String(50), nullable=False, index=True)
+    cache_key = db.Column(db.String(64), nullable=False)
+    value = db.Column(db.Text, nullable=False)
+
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_accessed = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (db.UniqueConstraint('namespace', 'cache_key', name='uq_ai_cache_namespace_key'),)
+
+class BackgroundJob(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    payload = db.Column(db.Text, nullable=True)  # JSON com os argumentos do handler
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_background_job_status', 'status', 'created_at'),)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
 # ================================
 # 🛠 HELPER FUNCTIONS GERAIS
 # ================================
@@ -874,12 +1880,235 @@ def calculate_profile_completion(user):
         completed += 1
     return round((completed / total) * 100)
 
+# =============================================================================
+# 🗄️ CACHE PERSISTENTE DE RESPOSTAS DA AI
+# =============================================================================
+AI_CACHES = {}
+
+class AIResponseCache:
+    """Cache persistente (tabela ``AICacheEntry``) com TTL e evicção LRU.
+
+    Cada instância usa o seu próprio ``namespace`` e mantém contadores de
+    hits/misses em memória, expostos em ``/api/ai-cache/stats``.
+    """
+
+    def __init__(self, namespace, ttl_seconds=None, max_entries=None):
+        self.namespace = namespace
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self.counters = Counter()
+        AI_CACHES[namespace] = self
+
+    @property
+    def ttl_seconds(self):
+        return self._ttl_seconds or app.config['AI_CACHE_TTL_SECONDS']
+
+    @property
+    def max_entries(self):
+        return self._max_entries or app.config['AI_CACHE_MAX_ENTRIES']
+
+    @staticmethod
+    def make_key(*parts):
+        """Gera uma chave SHA-256 estável a partir de valores serializáveis em JSON."""
+        raw = json.dumps(parts, sort_keys=True, default=AIResponseCache._key_default, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _key_default(value):
+        # Imagens (bytes JPEG) entram na chave pelo hash, sem serializar o conteúdo
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return hashlib.sha256(value).hexdigest()
+        return str(value)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def record_bypass(self):
+        """Pedido que ignorou o cache de propósito (ex.: reanálise forçada)."""
+        self._count('bypassed')
+
+    def record_request_hit(self):
+        """Resultado reaproveitado da memo do próprio request (``flask.g``)."""
+        self._count('request_hits')
+
+    def get(self, key):
+        try:
+            entry = AICacheEntry.query.filter_by(namespace=self.namespace, cache_key=key).first()
+            if entry is None:
+                self._count('misses')
+                return None
+
+            now = datetime.utcnow()
+            if entry.created_at < now - timedelta(seconds=self.ttl_seconds):
+                db.session.delete(entry)
+                db.session.commit()
+                self._count('misses')
+                self._count('expired')
+                return None
+
+            entry.hit_count = (entry.hit_count or 0) + 1
+            entry.last_accessed = now
+            db.session.commit()
+            self._count('hits')
+            return entry.value
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao ler cache AI ({self.namespace}): {e}")
+            self._count('errors')
+            return None
+
+    def set(self, key, value):
+        try:
+            now = datetime.utcnow()
+            entry = AICacheEntry.query.filter_by(namespace=self.namespace, cache_key=key).first()
+            if entry is None:
+                entry = AICacheEntry(namespace=self.namespace, cache_key=key, value=value)
+                db.session.add(entry)
+            else:
+                entry.value = value
+            entry.created_at = now
+            entry.last_accessed = now
+            db.session.commit()
+            self._count('stores')
+            self._evict()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao gravar cache AI ({self.namespace}): {e}")
+            self._count('errors')
+
+    def _evict(self):
+        """Remove entradas expiradas e, acima do limite, as menos usadas recentemente."""
+        base = AICacheEntry.query.filter_by(namespace=self.namespace)
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        expired = base.filter(AICacheEntry.created_at < cutoff).delete(synchronize_session=False)
+
+        overflow = base.count() - self.max_entries
+        evicted = 0
+        if overflow > 0:
+            stale_ids = [
+                row.id for row in base.order_by(AICacheEntry.last_accessed.asc()).limit(overflow).all()
+            ]
+            evicted = AICacheEntry.query.filter(AICacheEntry.id.in_(stale_ids)).delete(synchronize_session=False)
+        if expired or evicted:
+            db.session.commit()
+            self._count('expired', expired)
+            self._count('evictions', evicted)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters.get('hits', 0) + counters.get('misses', 0)
+        try:
+            entries = AICacheEntry.query.filter_by(namespace=self.namespace).count()
+        except Exception:
+            entries = None
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'bypassed': counters.get('bypassed', 0),
+            'request_hits': counters.get('request_hits', 0),
+            'stores': counters.get('stores', 0),
+            'expired': counters.get('expired', 0),
+            'evictions': counters.get('evictions', 0),
+            'errors': counters.get('errors', 0),
+            'hit_rate': round(counters.get('hits', 0) / lookups, 3) if lookups else 0.0,
+            'entries': entries,
+            'ttl_seconds': self.ttl_seconds,
+            'max_entries': self.max_entries
+        }
+
+class SingleFlightCache:
+    """Cache LRU em memória com coalescência (single-flight).
+
+    Pedidos concorrentes pela mesma chave esperam pela chamada que já está
+    em curso em vez de repetirem a chamada upstream. Só resultados aceites
+    por ``cacheable`` ficam guardados.
+    """
+
+    def __init__(self, name, max_entries, cacheable=bool):
+        self.name = name
+        self.max_entries = max_entries
+        self.cacheable = cacheable
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.counters = Counter()
+        AI_CACHES[name] = self
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return self._entries[key]
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self._inflight[key] = call
+                self.counters['misses'] += 1
+            else:
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            started = time.monotonic()
+            call['event'].wait()
+            with self._lock:
+                self.counters['coalesced_wait_ms'] += int((time.monotonic() - started) * 1000)
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = compute()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if call['error'] is None and self.cacheable(call['result']):
+                    self._entries[key] = call['result']
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.counters['evictions'] += 1
+            call['event'].set()
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            entries = len(self._entries)
+            inflight = len(self._inflight)
+        lookups = counters.get('hits', 0) + counters.get('misses', 0) + counters.get('coalesced', 0)
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'coalesced': counters.get('coalesced', 0),
+            'coalesced_wait_ms': counters.get('coalesced_wait_ms', 0),
+            'evictions': counters.get('evictions', 0),
+            'hit_rate': round((lookups - counters.get('misses', 0)) / lookups, 3) if lookups else 0.0,
+            'entries': entries,
+            'inflight': inflight,
+            'max_entries': self.max_entries
+        }
+
+meal_analysis_cache = AIResponseCache('meal_analysis')
+ingredient_detection_cache = AIResponseCache('ingredient_detection')
+
 # =============================================================================
 # 🛠 AZURE OPENAI AI FUNCTIONS
 # =============================================================================
 
 def get_revolutionary_mock_analysis():
     return {
+        "is_food": True,
         "foods_detected": ["Grilled Chicken", "Sweet Potato", "Broccoli", "Avocado"],
         "nutrition": {
             "calories": 485,
@@ -920,11 +2149,31 @@ def get_revolutionary_mock_analysis():
         ]
     }
 
-def call_advanced_food_ai(image_base64, user_context):
+# Campos do user_context que entram no prompt (e portanto na chave do cache)
+ANALYSIS_CONTEXT_FIELDS = ('age', 'gender', 'current_weight', 'target_weight', 'activity_level')
+# Incrementar sempre que o prompt de análise mudar, para invalidar o cache
+ANALYSIS_PROMPT_VERSION = 2
+
+def build_analysis_cache_key(image_bytes, user_context):
+    """Chave do cache: hash dos bytes da imagem normalizada + contexto do prompt."""
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    context = {field: user_context.get(field) for field in ANALYSIS_CONTEXT_FIELDS}
+    return AIResponseCache.make_key(ANALYSIS_PROMPT_VERSION, image_hash, context)
+
+def call_advanced_food_ai(image_bytes, user_context, bypass_cache=False):
     if client is None:
         logger.warning("Azure OpenAI client unavailable - using mock analysis")
         return json.dumps(get_revolutionary_mock_analysis())
 
+    cache_key = build_analysis_cache_key(image_bytes, user_context)
+    if bypass_cache:
+        meal_analysis_cache.record_bypass()
+    else:
+        cached = meal_analysis_cache.get(cache_key)
+        if cached is not None:
+            logger.info("⚡ Análise servida do cache AI")
+            return cached
+
     system_prompt = f"""You are an advanced AI nutritionist with expertise in behavioral psychology.
 
     USER CONTEXT:
@@ -936,9 +2185,13 @@ def call_advanced_food_ai(image_base64, user_context):
 
     Analyze this meal image and provide insights in STRICT JSON format.
 
+    First decide whether the image actually shows food or a meal. If it does NOT,
+    respond ONLY with {{"is_food": false, "foods_detected": []}}.
+
     You MUST respond with ONLY valid JSON, no additional text:
 
     {{
+        "is_food": true,
         "foods_detected": ["food1", "food2", "food3"],
         "nutrition": {{
             "calories": 500,
@@ -973,15 +2226,14 @@ def call_advanced_food_ai(image_base64, user_context):
     IMPORTANT: Return ONLY the JSON object, no markdown, no explanations."""
     try:
         logger.info("🤖 Chamando Azure OpenAI para análise...")
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = create_chat_completion(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {
                     "role": "user",
                     "content": [
                         {"type": "text", "text": "Analyze this meal with revolutionary AI insights. Return only JSON."},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                        {"type": "image_url", "image_url": {"url": jpeg_data_url(image_bytes)}}
                     ]
                 }
             ],
@@ -994,6 +2246,13 @@ def call_advanced_food_ai(image_base64, user_context):
         if ai_response.startswith('```json'):
             ai_response = ai_response.replace('```json', '').replace('```', '').strip()
 
+        # Só guardamos respostas JSON válidas, nunca o fallback mock
+        try:
+            if isinstance(json.loads(ai_response), dict):
+                meal_analysis_cache.set(cache_key, ai_response)
+        except ValueError:
+            pass
+
         return ai_response
     except Exception as e:
         logger.error(f"❌ Erro Azure OpenAI: {str(e)}")
@@ -1004,6 +2263,7 @@ def parse_ai_response(ai_response):
         if ai_response and ai_response.strip().startswith('{'):
             data = json.loads(ai_response)
             cleaned_data = {
+                'is_food': bool(data.get('is_food', True)),
                 'foods_detected': data.get('foods_detected', ['Unknown Food']),
                 'nutrition': {
                     'calories': int(data.get('nutrition', {}).get('calories', 450)),
@@ -1035,7 +2295,251 @@ def parse_ai_response(ai_response):
         logger.error(f"Erro ao parsear resposta do AI: {str(e)}")
     return get_revolutionary_mock_analysis()
 
-def estimate_nutrition_from_text(description):
+# ------------------------
+# TABELA LOCAL DE NUTRIENTES
+# ------------------------
+# "2 ovos e torrada" resolve-se sem GPT: cada parte passa por
+# translate_ingredient (quantidade, unidade e nome em inglês) e o nome é
+# procurado em data/nutrients.csv. O GPT só vê as partes que não resolvem.
+# Vírgulas separam sempre; "e"/"com" só quando todas as partes resolvem,
+# para "mac and cheese" não virar queijo + "mac".
+NUTRIENT_ITEM_SEPARATORS = re.compile(r'\s*(?:(?<!\d),|,(?!\d)|[;\n])\s*')
+NUTRIENT_ITEM_CONNECTORS = re.compile(r'\s*\+\s*|\s+(?:and|with|plus|e|com|mais|y|con)\s+', re.IGNORECASE)
+# Gramas por unidade quando o alimento não define a sua (ml ≈ g). Latas não
+# têm valor genérico: sem ``can_g`` o item fica para o GPT
+NUTRIENT_UNIT_GRAMS = {
+    'g': 1, 'kg': 1000, 'ml': 1, 'l': 1000, 'oz': 28.35, 'lb': 453.6,
+    'cup': 240, 'tbsp': 15, 'tsp': 5, 'handful': 30, 'clove': 5,
+}
+NUTRIENT_FOOD_UNITS = ('piece', 'slice', 'cup', 'can')
+NUTRIENT_FIELDS = ('calories', 'protein', 'carbs', 'fat')
+NUTRIENT_MODIFIER_KEYS = {normalize_ingredient(word) for word in INGREDIENT_MODIFIER_TRANSLATIONS}
+
+class NutrientTable:
+    """
+    Nutrientes por 100 g indexados pela chave ``normalize_ingredient`` do nome
+    e dos sinónimos. ``serving_g`` é a porção sem quantidade; ``piece_g``,
+    ``slice_g``, ``cup_g`` e ``can_g`` os gramas de uma unidade desse
+    alimento; ``side_g`` a porção quando vem junto de outro ("café com leite").
+    """
+
+    def __init__(self, rows=()):
+        self.entries = {}
+        for row in rows:
+            entry = {field: float(row[field]) for field in NUTRIENT_FIELDS}
+            entry['name'] = row['name']
+            for field in ('serving_g', 'side_g') + tuple(f"{unit}_g" for unit in NUTRIENT_FOOD_UNITS):
+                entry[field] = float(row[field]) if row.get(field) else None
+            for name in [row['name']] + (row.get('aliases') or '').split('|'):
+                key = normalize_ingredient(name)
+                if key:
+                    self.entries.setdefault(key, entry)
+
+    @classmethod
+    def load(cls, path):
+        if not path or not os.path.exists(path):
+            logger.warning(f"⚠️ Tabela de nutrientes não encontrada: {path}")
+            return cls()
+        with open(path, encoding='utf-8') as fh:
+            return cls(csv.DictReader(fh))
+
+    def lookup(self, name):
+        """Entrada do alimento, tolerando modificadores ("grilled", "fresh")."""
+        key = normalize_ingredient(name)
+        if key in self.entries:
+            return self.entries[key]
+        stripped = ' '.join(token for token in key.split() if token not in NUTRIENT_MODIFIER_KEYS)
+        return self.entries.get(stripped)
+
+    @staticmethod
+    def portion_grams(entry, quantity, unit, joined=False):
+        """Gramas de ``quantity`` × ``unit`` deste alimento, ou ``None`` se não
+        der para saber. ``joined``: o item veio depois de "com"/"e"."""
+        count = 1.0 if quantity is None else quantity
+        if unit is None and quantity is None and joined and entry['side_g']:
+            grams = entry['side_g']
+        elif unit is None:
+            grams = entry['piece_g'] or entry['serving_g']
+        elif unit in NUTRIENT_FOOD_UNITS and entry[f"{unit}_g"]:
+            grams = entry[f"{unit}_g"]
+        elif unit == 'piece':
+            grams = entry['serving_g']
+        else:
+            grams = NUTRIENT_UNIT_GRAMS.get(unit)
+        return count * grams if grams else None
+
+_nutrient_table = None
+_nutrient_table_lock = threading.Lock()
+nutrition_estimate_stats = Counter()
+_nutrition_estimate_lock = threading.Lock()
+
+def get_nutrient_table():
+    global _nutrient_table
+    if _nutrient_table is None:
+        with _nutrient_table_lock:
+            if _nutrient_table is None:
+                _nutrient_table = NutrientTable.load(app.config['NUTRIENT_TABLE_PATH'])
+    return _nutrient_table
+
+def _count_nutrition_estimate(name):
+    with _nutrition_estimate_lock:
+        nutrition_estimate_stats[name] += 1
+
+def split_meal_description(description):
+    return [part.strip() for part in NUTRIENT_ITEM_SEPARATORS.split(description) if part and part.strip()]
+
+def resolve_nutrient_item(table, item, joined=False):
+    """``(entrada, gramas)`` de um item da descrição, ou ``None``."""
+    parsed = translate_ingredient(item)
+    _, _, rest = parse_ingredient_quantity(item)
+    entry = table.lookup(parsed['name']) or table.lookup(rest)
+    grams = entry and NutrientTable.portion_grams(entry, parsed['quantity'], parsed['unit'], joined)
+    return (entry, grams) if grams else None
+
+def estimate_nutrition_locally(description):
+    """
+    Soma os macros das partes da descrição que a tabela resolve.
+
+    Devolve ``{'totals', 'resolved', 'unresolved'}``; ``unresolved`` são os
+    textos originais das partes que ficam para o GPT.
+    """
+    table = get_nutrient_table()
+    totals = dict.fromkeys(NUTRIENT_FIELDS, 0.0)
+    resolved, unresolved = [], []
+    for part in split_meal_description(description):
+        items = [part]
+        matches = [resolve_nutrient_item(table, part)]
+        if matches[0] is None:
+            items = [item.strip() for item in NUTRIENT_ITEM_CONNECTORS.split(part) if item.strip()]
+            matches = [
+                resolve_nutrient_item(table, item, joined=position > 0) for position, item in enumerate(items)
+            ] if len(items) > 1 else [None]
+        if not all(matches):
+            unresolved.append(part)
+            continue
+        for item, (entry, grams) in zip(items, matches):
+            for field in NUTRIENT_FIELDS:
+                totals[field] += entry[field] * grams / 100
+            resolved.append({'item': item, 'food': entry['name'], 'grams': round(grams, 1)})
+    return {'totals': totals, 'resolved': resolved, 'unresolved': unresolved}
+
+def round_nutrition(totals):
+    return {
+        'calories': int(round(totals['calories'])),
+        'protein': round(totals['protein'], 1),
+        'carbs': round(totals['carbs'], 1),
+        'fat': round(totals['fat'], 1),
+    }
+
+# ------------------------
+# CACHE DE ESTIMATIVAS POR TEXTO
+# ------------------------
+# As mesmas refeições ("oatmeal with berries") repetem-se todos os dias. A
+# chave é a descrição normalizada; o nível por utilizador guarda as respostas
+# que cada um já viu, o global partilha-as entre utilizadores.
+MEAL_TEXT_PUNCTUATION = re.compile(r'[^\w\s]+')
+TEXT_ESTIMATE_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+TEXT_ESTIMATE_CACHES = {
+    kind: (
+        AIResponseCache(f"{kind}_user", ttl_seconds=TEXT_ESTIMATE_CACHE_TTL_SECONDS, max_entries=20000),
+        AIResponseCache(kind, ttl_seconds=TEXT_ESTIMATE_CACHE_TTL_SECONDS, max_entries=5000),
+    )
+    for kind in ('nutrition_estimate', 'meal_title')
+}
+
+@functools.lru_cache(maxsize=4096)
+def normalize_meal_description(description):
+    """
+    ``"Rice with 2 Eggs!"`` → ``"2 eggs, rice"``: partes separadas por
+    vírgulas e conectores ("with", "e"), cada uma em casefold, sem pontuação
+    nem conectores, e as partes ordenadas. A quantidade fica com o seu item.
+    """
+    parts = []
+    for part in split_meal_description(description):
+        for item in NUTRIENT_ITEM_CONNECTORS.split(part):
+            words = MEAL_TEXT_PUNCTUATION.sub(' ', item.casefold()).split()
+            words = [word for word in words if word not in INGREDIENT_CONNECTORS]
+            if words:
+                parts.append(' '.join(words))
+    return ', '.join(sorted(parts))
+
+def cached_text_estimate(kind, description, user_id, compute):
+    """
+    Resultado de ``compute()`` para a descrição, lido primeiro do nível do
+    utilizador, depois do global. ``None`` (falha do GPT) nunca é guardado.
+    """
+    normalized = normalize_meal_description(description)
+    if not normalized or not has_app_context():
+        return compute()
+
+    user_cache, global_cache = TEXT_ESTIMATE_CACHES[kind]
+    global_key = AIResponseCache.make_key(kind, normalized)
+    user_key = AIResponseCache.make_key(kind, user_id, normalized) if user_id else None
+    if user_key:
+        cached = user_cache.get(user_key)
+        if cached is not None:
+            return json.loads(cached)
+    cached = global_cache.get(global_key)
+    if cached is not None:
+        if user_key:
+            user_cache.set(user_key, cached)
+        return json.loads(cached)
+
+    result = compute()
+    if result is not None:
+        value = json.dumps(result)
+        global_cache.set(global_key, value)
+        if user_key:
+            user_cache.set(user_key, value)
+    return result
+
+def estimate_nutrition_from_text(description, user_id=None):
+    """
+    Estimativa nutricional de uma descrição de refeição: tabela local para as
+    partes conhecidas, GPT só para o resto (ou para tudo, se nada resolver).
+    As respostas que passaram pelo GPT ficam em cache por descrição normalizada.
+    """
+    local = estimate_nutrition_locally(description)
+    if local['resolved'] and not local['unresolved']:
+        _count_nutrition_estimate('local')
+        return round_nutrition(local['totals'])
+    estimate = cached_text_estimate(
+        'nutrition_estimate', description, user_id,
+        lambda: estimate_nutrition_with_model(description, local)
+    )
+    if estimate is None and local['resolved']:
+        # GPT falhou: fica a parte local, marcada como incompleta (e sem cache)
+        _count_nutrition_estimate('incomplete')
+        return {**round_nutrition(local['totals']), 'partial': True}
+    return estimate
+
+def estimate_nutrition_with_model(description, local):
+    if local['resolved']:
+        estimate = ai_estimate_nutrition(', '.join(local['unresolved']))
+        if estimate is None:
+            return None
+        _count_nutrition_estimate('partial')
+        return round_nutrition({field: local['totals'][field] + estimate[field] for field in NUTRIENT_FIELDS})
+
+    estimate = ai_estimate_nutrition(description)
+    if estimate is not None:
+        _count_nutrition_estimate('model')
+    return estimate
+
+def nutrition_estimate_report():
+    with _nutrition_estimate_lock:
+        stats = dict(nutrition_estimate_stats)
+    estimates = sum(stats.values())
+    return {
+        'estimates': estimates,
+        'local': stats.get('local', 0),
+        'partial': stats.get('partial', 0),
+        'model': stats.get('model', 0),
+        'incomplete': stats.get('incomplete', 0),
+        'local_rate': round(stats.get('local', 0) / estimates, 3) if estimates else 0.0
+    }
+
+def ai_estimate_nutrition(description):
     """Estimate nutrition facts using Azure GPT based on meal description."""
     system_prompt = (
         "You are a nutrition expert. Given a meal description, "
@@ -1046,8 +2550,7 @@ def estimate_nutrition_from_text(description):
         logger.warning("Azure OpenAI client unavailable - skipping nutrition estimation")
         return None
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = create_chat_completion(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": description},
@@ -1069,8 +2572,13 @@ def estimate_nutrition_from_text(description):
         logger.error(f"Erro estimando nutrição: {e}")
         return None
 
-def generate_meal_title(description):
+def generate_meal_title(description, user_id=None):
     """Return a short and simple title for the meal description."""
+    title = cached_text_estimate('meal_title', description, user_id, lambda: ai_generate_meal_title(description))
+    return title or description[:60]
+
+def ai_generate_meal_title(description):
+    """Título do GPT, ou ``None`` se não houver cliente ou a chamada falhar."""
     system_prompt = (
         "You create very simple meal titles. "
         "Given a meal description, respond with a concise 1 to 4 word name "
@@ -1078,10 +2586,9 @@ def generate_meal_title(description):
     )
     if client is None:
         logger.warning("Azure OpenAI client unavailable - using description as title")
-        return description[:60]
+        return None
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = create_chat_completion(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": description},
@@ -1090,23 +2597,32 @@ def generate_meal_title(description):
             temperature=0.3,
         )
         title = response.choices[0].message.content.strip()
-        return re.sub(r"[\r\n]+", " ", title)[:60]
+        return re.sub(r"[\r\n]+", " ", title)[:60] or None
     except Exception as e:
         logger.error(f"Erro ao gerar título: {e}")
-        return description[:60]
+        return None
 
 def ai_filter_food_items(items):
     """Use GPT to return only the edible food items from the list."""
+    flags = ai_classify_food_items(items)
+    return items if flags is None else [item for item, is_food in zip(items, flags) if is_food]
+
+def ai_classify_food_items(items):
+    """
+    ``[bool]`` alinhado com ``items`` (comestível ou não) segundo o GPT, ou
+    ``None`` se a chamada falhar. O GPT responde com os números dos itens,
+    por isso nomes traduzidos ou reescritos não se perdem.
+    """
     system_prompt = (
-        "You are a culinary expert. From the list provided, return ONLY the items that are edible foods as a JSON array of strings."
+        "You are a culinary expert. The user sends a numbered list of items. "
+        "Return ONLY the numbers of the items that are edible foods as a JSON array of integers."
     )
     if client is None:
         logger.warning("Azure OpenAI client unavailable - skipping ingredient filtering")
-        return items
+        return None
     try:
-        joined = ", ".join(items)
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        joined = "\n".join(f"{number}. {item}" for number, item in enumerate(items, 1))
+        response = create_chat_completion(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": joined},
@@ -1119,10 +2635,100 @@ def ai_filter_food_items(items):
             content = content.replace("```json", "").replace("```", "").strip()
         data = json.loads(content)
         if isinstance(data, list):
-            return [str(i).strip() for i in data]
+            numbers = {int(number) for number in data}
+            return [number in numbers for number in range(1, len(items) + 1)]
     except Exception as e:
         logger.error(f"Erro na validação AI de ingredientes: {e}")
-    return items
+    return None
+
+# ------------------------
+# FILTRO LOCAL DE ALIMENTOS
+# ------------------------
+# O vocabulário de ingredientes e o NON_FOOD_LEXICON decidem a maioria dos
+# itens; só os indecisos vão ao GPT, e a resposta fica em cache por item
+# normalizado para a próxima vez.
+NON_FOOD_TOKENS = {normalize_ingredient(word) for word in NON_FOOD_LEXICON}
+FOOD_FILTER_CONNECTOR_TOKENS = {normalize_ingredient(word) for word in INGREDIENT_CONNECTORS}
+food_classification_cache = AIResponseCache('food_classification', ttl_seconds=90 * 24 * 60 * 60, max_entries=20000)
+food_filter_stats = Counter()
+_food_filter_lock = threading.Lock()
+
+def _count_food_filter(name, amount=1):
+    with _food_filter_lock:
+        food_filter_stats[name] += amount
+
+def classify_food_item_locally(item):
+    """``True`` (comida), ``False`` (não é comida) ou ``None`` (indeciso)."""
+    _, _, rest = parse_ingredient_quantity(item)
+    names = {normalize_ingredient(rest), normalize_ingredient(translate_ingredient(item.strip())['name'])}
+    tokens = {token for name in names for token in name.split()}
+    # Só nomes completos contam: uma palavra solta só se for ela própria um
+    # alimento ("green" ou "de" de nomes compostos não chegam)
+    is_food = bool(get_food_vocabulary().known_names(names | tokens))
+    content_tokens = set(normalize_ingredient(rest).split()) - FOOD_FILTER_CONNECTOR_TOKENS
+    # Não é comida só se todas as palavras o disserem: "hot dog" ou
+    # "glass noodles" ficam indecisos e vão ao GPT
+    is_non_food = bool(content_tokens) and content_tokens <= NON_FOOD_TOKENS
+    if is_food and not (tokens & NON_FOOD_TOKENS):
+        return True
+    if is_non_food and not is_food:
+        return False
+    return None
+
+def food_classification_key(item):
+    """Chave do cache sem quantidade: "2 ovos" e "3 ovos" partilham a decisão."""
+    _, _, rest = parse_ingredient_quantity(item)
+    return normalize_ingredient(rest) or normalize_ingredient(item)
+
+def filter_food_items(items):
+    """
+    Mantém só os itens comestíveis, pela ordem original. Decide localmente
+    sempre que possível, depois pelo cache de decisões anteriores e só
+    então pergunta ao GPT pelos itens que sobram.
+    """
+    decisions = {}
+    undecided = []
+    for item in items:
+        decision = classify_food_item_locally(item)
+        if decision is not None:
+            _count_food_filter('local_food' if decision else 'local_non_food')
+            decisions[item] = decision
+            continue
+        cached = food_classification_cache.get(food_classification_key(item))
+        if cached is not None:
+            _count_food_filter('cached')
+            decisions[item] = cached == 'food'
+            continue
+        undecided.append(item)
+
+    if undecided:
+        _count_food_filter('upstream_calls')
+        _count_food_filter('upstream_items', len(undecided))
+        flags = ai_classify_food_items(undecided)
+        if flags is None:
+            # Sem resposta do GPT: não se grava nada e os itens passam
+            for item in undecided:
+                decisions[item] = True
+        else:
+            for item, is_food in zip(undecided, flags):
+                decisions[item] = is_food
+                food_classification_cache.set(food_classification_key(item), 'food' if is_food else 'not_food')
+
+    return [item for item in items if decisions[item]]
+
+def food_filter_report():
+    with _food_filter_lock:
+        stats = dict(food_filter_stats)
+    items = sum(stats.get(name, 0) for name in ('local_food', 'local_non_food', 'cached', 'upstream_items'))
+    return {
+        'items': items,
+        'local_food': stats.get('local_food', 0),
+        'local_non_food': stats.get('local_non_food', 0),
+        'cached': stats.get('cached', 0),
+        'upstream_items': stats.get('upstream_items', 0),
+        'upstream_calls': stats.get('upstream_calls', 0),
+        'upstream_rate': round(stats.get('upstream_items', 0) / items, 3) if items else 0.0
+    }
 
 def generate_highly_personalized_recipes(user, ingredients_list, preferences, count=3):
     """Gera receitas altamente personalizadas via GPT-4o"""
@@ -1154,8 +2760,8 @@ def generate_highly_personalized_recipes(user, ingredients_list, preferences, co
 
 
     recipe_configs = create_creative_recipe_configs(preferences, count)
-    recipes = []
-    for i, config in enumerate(recipe_configs):
+
+    def generate_option(i, config):
         system_prompt = f"""You are a world-class creative chef and nutritionist with expertise in {config['cuisine_expertise']}.
 
         MISSION: Create a {config['creativity_level']} and {config['style_description']} recipe that is {config['meal_context']}.
@@ -1210,32 +2816,41 @@ def generate_highly_personalized_recipes(user, ingredients_list, preferences, co
             ]
         }}"""
 
-        try:
-            logger.info(f"🎨 Gerando opção de receita ({config['style_description']}) {i+1} com GPT-4o...")
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Create an incredibly {config['creativity_level']} {preferences['meal_type']} recipe that's {config['style_description']} using: {', '.join(ingredients_list)}. Make it unique, memorable, and exactly what someone craving {config['mood']} would want!"}
-                ],
-                max_tokens=1500,
-                temperature=config["temperature"]
-            )
-            ai_response = response.choices[0].message.content.strip()
+        logger.info(f"🎨 Gerando opção de receita ({config['style_description']}) {i+1} com GPT-4o...")
+        response = create_chat_completion(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"Create an incredibly {config['creativity_level']} {preferences['meal_type']} recipe that's {config['style_description']} using: {', '.join(ingredients_list)}. Make it unique, memorable, and exactly what someone craving {config['mood']} would want!"}
+            ],
+            max_tokens=1500,
+            temperature=config["temperature"]
+        )
+        ai_response = response.choices[0].message.content.strip()
 
-            if ai_response.startswith('```json'):
-                ai_response = ai_response.replace('```json', '').replace('```', '').strip()
+        if ai_response.startswith('```json'):
+            ai_response = ai_response.replace('```json', '').replace('```', '').strip()
 
-            recipe_data = json.loads(ai_response)
-            recipe_data = enhance_recipe_data(recipe_data, config, ingredients_list)
-            recipes.append(recipe_data)
+        recipe_data = json.loads(ai_response)
+        return enhance_recipe_data(recipe_data, config, ingredients_list)
 
-            logger.info(f"✅ Receita ({config['style_description']}) gerada com sucesso via GPT-4o")
+    # As opções são geradas em paralelo; quem passar do prazo recebe fallback
+    deadline = app.config['RECIPE_OPTION_DEADLINE_SECONDS']
+    futures = [ai_executor.submit(generate_option, i, config) for i, config in enumerate(recipe_configs)]
+    concurrent.futures.wait(futures, timeout=deadline)
 
+    recipes = []
+    for i, (config, future) in enumerate(zip(recipe_configs, futures)):
+        if not future.done():
+            future.cancel()
+            logger.warning(f"⏱️ Receita {i+1} excedeu o prazo de {deadline}s - usando fallback")
+            recipes.append(create_fallback_recipe(config, ingredients_list, i))
+            continue
+        try:
+            recipes.append(future.result())
+            logger.info(f"✅ Receita ({config['style_description']}) gerada com sucesso via GPT-4o")
         except Exception as e:
             logger.error(f"❌ Erro ao gerar receita {i+1}: {str(e)}")
-            fallback_recipe = create_fallback_recipe(config, ingredients_list, i)
-            recipes.append(fallback_recipe)
+            recipes.append(create_fallback_recipe(config, ingredients_list, i))
 
     return recipes
 
@@ -1445,23 +3060,246 @@ def create_fallback_recipe(config, ingredients_list, index):
 
 
 # =============================================================================
-# 🎨 IMAGE PROCESSING (pode usar futuramente para gerar miniaturas)
+# 📦 ARMAZENAMENTO DE FICHEIROS (BLOB STORE)
+# =============================================================================
+class LocalBlobStore:
+    """Blob store no disco local, servido por ``/api/images/<name>``.
+
+    Com ``shard=True`` cada ficheiro fica em ``<root>/ab/cd/<name>`` (prefixo
+    do sha1 do nome), para nenhum diretório crescer sem limite. Ficheiros
+    antigos gravados diretamente na raiz continuam a ser encontrados.
+
+    Outros backends (S3, Azure Blob...) só precisam de implementar
+    ``exists``, ``put``, ``open``, ``delete``, ``names`` e ``url`` e
+    substituir ``blob_store``.
+    """
+
+    def __init__(self, root, shard=False):
+        self.root = root
+        self.shard = shard
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        name = secure_filename(name)
+        if not self.shard:
+            return os.path.join(self.root, name)
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], name)
+
+    def locate(self, name):
+        """Caminho do ficheiro existente (com shards ou legado na raiz) ou ``None``."""
+        for candidate in (self.path(name), os.path.join(self.root, secure_filename(name))):
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def writable_path(self, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def exists(self, name):
+        return self.locate(name) is not None
+
+    def put(self, name, data):
+        # Escrita atómica: nunca servimos um ficheiro meio escrito
+        final_path = self.writable_path(name)
+        tmp_path = f"{final_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, final_path)
+
+    def open(self, name):
+        path = self.locate(name)
+        if not path:
+            raise FileNotFoundError(name)
+        return open(path, 'rb')
+
+    def delete(self, name):
+        path = self.locate(name)
+        if not path:
+            return False
+        os.remove(path)
+        return True
+
+    def names(self):
+        """Itera ``(nome, caminho)`` de todos os ficheiros: os legados na raiz e
+        os dos diretórios de shard (outros subdiretórios são ignorados)."""
+        with os.scandir(self.root) as entries:
+            top = list(entries)
+        for entry in top:
+            if entry.is_file():
+                yield entry.name, entry.path
+            elif self.shard and entry.is_dir() and BLOB_SHARD_DIR.match(entry.name):
+                for shard_dir in os.scandir(entry.path):
+                    if shard_dir.is_dir() and BLOB_SHARD_DIR.match(shard_dir.name):
+                        for blob in os.scandir(shard_dir.path):
+                            if blob.is_file():
+                                yield blob.name, blob.path
+
+    def url(self, name):
+        return f"/api/images/{name}"
+
+    def url_exists(self, url):
+        """``False`` só para URLs locais (``/api/images/...``) cujo ficheiro já não existe."""
+        if not url or not url.startswith('/api/images/'):
+            return True
+        return self.exists(url.split('?', 1)[0].rsplit('/', 1)[-1])
+
+BLOB_SHARD_DIR = re.compile(r'^[0-9a-f]{2}$')
+
+blob_store = LocalBlobStore(app.config['UPLOAD_FOLDER'], shard=True)
+derivative_store = LocalBlobStore(os.path.join(app.config['UPLOAD_FOLDER'], 'derivatives'), shard=True)
+
+# =============================================================================
+# 🎨 IMAGE PROCESSING (miniaturas e derivados)
 # =============================================================================
-def process_image(image_stream):
+def process_image(image_stream, max_edge=None, image_format='JPEG', enhance=True):
     image = Image.open(image_stream)
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(1.2)
-    image = image.filter(ImageFilter.SHARPEN)
+    if max_edge:
+        image.draft('RGB', (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if max_edge and max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    if enhance:
+        enhancer = ImageEnhance.Contrast(image)
+        image = enhancer.enhance(1.2)
+        image = image.filter(ImageFilter.SHARPEN)
     buffer = io.BytesIO()
-    image.save(buffer, format='JPEG')
+    image.save(buffer, format=image_format, quality=80)
     return buffer.getvalue()
 
+def image_derivative_name(filename, size, image_format):
+    stem = os.path.splitext(secure_filename(filename))[0]
+    extension = 'webp' if image_format == 'WEBP' else 'jpg'
+    return f"{stem}_{size}.{extension}"
+
+def get_or_create_image_derivative(filename, size, image_format='JPEG'):
+    """Devolve o nome do derivado (gerando-o na primeira vez) ou ``None``
+    se o original não existir."""
+    name = image_derivative_name(filename, size, image_format)
+    if derivative_store.exists(name):
+        return name
+    if not blob_store.exists(filename):
+        return None
+    with blob_store.open(filename) as original:
+        # Miniaturas só com o sharpen leve do thumbnail, sem realce de contraste
+        data = process_image(original, max_edge=size, image_format=image_format, enhance=False)
+    derivative_store.put(name, data)
+    return name
+
+image_preprocess_stats = Counter()
+_image_preprocess_lock = threading.Lock()
+
+# O Pillow também recusa (DecompressionBombError) imagens acima de 2x este valor
+Image.MAX_IMAGE_PIXELS = app.config['MAX_IMAGE_PIXELS']
+
+class InvalidImageError(ValueError):
+    """Upload que não é uma imagem válida ou excede o limite de píxeis."""
+
+def upload_size(file_storage):
+    """Tamanho em bytes do ficheiro enviado, sem o ler para memória."""
+    stream = file_storage.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+def prepare_image_for_ai(image, bytes_in=0, save_path=None):
+    """
+    Normaliza a foto uma única vez para todas as chamadas AI: corrige a
+    orientação EXIF, converte para RGB, reduz ao lado máximo configurado e
+    re-codifica em JPEG sem metadados. O mesmo buffer JPEG é gravado em
+    ``save_path`` (se indicado) e devolvido em ``jpeg`` sem cópias: o base64
+    só é gerado quando a imagem vai mesmo ao GPT-4o (ver ``jpeg_data_url``).
+    """
+    max_edge = app.config['AI_IMAGE_MAX_EDGE']
+    # Em JPEG o decoder já reduz por 1/2, 1/4 ou 1/8 ao descodificar
+    image.draft('RGB', (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=app.config['AI_IMAGE_JPEG_QUALITY'], optimize=True)
+    bytes_sent = buffer.getbuffer().nbytes
+
+    if save_path:
+        with open(save_path, 'wb') as fh:
+            fh.write(buffer.getbuffer())
+
+    with _image_preprocess_lock:
+        image_preprocess_stats['images'] += 1
+        image_preprocess_stats['bytes_in'] += bytes_in
+        image_preprocess_stats['bytes_sent'] += bytes_sent
+    logger.info(f"🖼️ Imagem preparada para AI: {bytes_in} → {bytes_sent} bytes {image.size}")
+
+    return {
+        'image': image,
+        'jpeg': buffer.getbuffer(),
+        'bytes_in': bytes_in,
+        'bytes_sent': bytes_sent
+    }
+
+def load_upload_for_ai(file_storage, save_path=None):
+    """Abre o upload (só o cabeçalho), valida o número de píxeis e prepara-o."""
+    try:
+        image = Image.open(file_storage.stream)
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(str(e))
+
+    width, height = image.size
+    if width * height > app.config['MAX_IMAGE_PIXELS']:
+        raise InvalidImageError(f"Imagem demasiado grande ({width}x{height})")
+
+    return prepare_image_for_ai(image, bytes_in=upload_size(file_storage), save_path=save_path)
+
+# DCT-II ortonormal 32x32 para o pHash
+_PHASH_SIZE = 32
+_PHASH_DCT = np.array([
+    [np.sqrt((1 if k == 0 else 2) / _PHASH_SIZE) * np.cos(np.pi * (2 * n + 1) * k / (2 * _PHASH_SIZE))
+     for n in range(_PHASH_SIZE)]
+    for k in range(_PHASH_SIZE)
+])
+
+def compute_image_phash(image):
+    """pHash de 64 bits (hex) da imagem: DCT da versão 32x32 em cinzento e
+    comparação das 8x8 frequências mais baixas com a mediana."""
+    gray = image.convert('L').resize((_PHASH_SIZE, _PHASH_SIZE), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+    low = (_PHASH_DCT @ pixels @ _PHASH_DCT.T)[:8, :8]
+    # A componente DC só reflete o brilho médio, fica fora da mediana
+    bits = (low > np.median(low.flatten()[1:])).flatten()
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+def phash_distance(hash_a, hash_b):
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+def image_preprocess_report():
+    with _image_preprocess_lock:
+        stats = dict(image_preprocess_stats)
+    bytes_in = stats.get('bytes_in', 0)
+    return {
+        'images': stats.get('images', 0),
+        'bytes_in': bytes_in,
+        'bytes_sent': stats.get('bytes_sent', 0),
+        'ratio': round(stats.get('bytes_sent', 0) / bytes_in, 3) if bytes_in else None,
+        'max_edge': app.config['AI_IMAGE_MAX_EDGE'],
+        'jpeg_quality': app.config['AI_IMAGE_JPEG_QUALITY']
+    }
+
 # =============================================================================
 # 🌐 ROTAS DA API
 # =============================================================================
 @app.before_request
 def log_request_info():
-    if request.endpoint and not request.endpoint.startswith('static'):
+    # Imagens não tocam na sessão, para não ganharem "Vary: Cookie"
+    if request.endpoint and not request.endpoint.startswith('static') and request.endpoint != 'serve_image':
         logger.info(f"🌐 {request.method} {request.path} - Session: {dict(session)}")
 
 @app.after_request
@@ -1645,6 +3483,11 @@ def health_check():
         'message': 'NutriVision Pro Revolutionary API',
         'version': '2.0.1',
         'timestamp': datetime.utcnow().isoformat(),
+        'upstreams': {
+            guard.name: guard.stats() for guard in (chat_upstream, image_upstream)
+        },
+        'image_preprocessing': image_preprocess_report(),
+        'photo_dedup': photo_dedup_report(),
         'features': [
             'Advanced AI Analysis',
             'Food DNA Profiling',
@@ -1659,6 +3502,17 @@ def health_check():
         ]
     }), 200
 
+# ------------------------
+# ESTATÍSTICAS DO CACHE AI
+# ------------------------
+@app.route('/api/ai-cache/stats', methods=['GET'])
+def ai_cache_stats():
+    return jsonify({
+        'caches': {name: cache.stats() for name, cache in AI_CACHES.items()},
+        'food_filter': food_filter_report(),
+        'nutrition_estimates': nutrition_estimate_report()
+    }), 200
+
 # ------------------------
 # ESTATÍSTICAS AVANÇADAS DO USUÁRIO
 # ------------------------
@@ -1735,160 +3589,478 @@ def analyze_meal_revolutionary():
             return jsonify({'error': 'Imagem obrigatória'}), 400
 
         image_file = request.files['image']
-        meal_type = request.form.get('meal_type', 'unknown')
-        mood_before = request.form.get('mood_before', 'neutral')
-        social_context = request.form.get('social_context', 'alone')
+        options = {
+            'meal_type': request.form.get('meal_type', 'unknown'),
+            'mood_before': request.form.get('mood_before', 'neutral'),
+            'social_context': request.form.get('social_context', 'alone'),
+            'force_reanalysis': request.form.get('force_reanalysis', 'false').lower() in ('1', 'true', 'yes')
+        }
+        run_async = request.form.get('async', 'false').lower() in ('1', 'true', 'yes')
 
-        image = Image.open(image_file.stream)
         image_filename = f"{uuid.uuid4()}.jpg"
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], image_filename)
-        image.save(image_path)
+        image_path = blob_store.writable_path(image_filename)
+        try:
+            prepared = load_upload_for_ai(image_file, save_path=image_path)
+        except InvalidImageError as e:
+            return jsonify({'error': f'Imagem inválida: {str(e)}'}), 400
+        image_bytes = prepared['jpeg']
+        options['image_phash'] = compute_image_phash(prepared['image'])
+
+        # Modo assíncrono: a imagem já está gravada, o resto corre na fila de jobs
+        if run_async:
+            job_id = enqueue_background_job(user.id, 'meal_analysis', {'image_path': image_path, **options})
+            return jsonify({
+                'job_id': job_id,
+                'status': 'pending',
+                'status_url': f'/api/jobs/{job_id}',
+                'events_url': f'/api/jobs/{job_id}/events'
+            }), 202
 
-        buffer = io.BytesIO()
-        image.save(buffer, format='JPEG')
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
+        ai_data = reuse_duplicate_analysis(user.id, options['image_phash'], options['force_reanalysis']) \
+            or run_meal_ai_analysis(image_bytes, build_user_context(user), options['force_reanalysis'])
+        if ai_data is None:
+            discard_upload(image_path)
+            return jsonify({'error': NOT_FOOD_ERROR}), 400
 
-        if not is_food_image(image_base64):
-            return jsonify({'error': 'The image you inserted is not food related.'}), 400
+        return jsonify(save_meal_analysis(user, ai_data, image_path, options)), 200
 
-        user_context = {
-            'age': user.age,
-            'gender': user.gender,
-            'current_weight': user.current_weight,
-            'target_weight': user.target_weight,
-            'activity_level': user.activity_level,
-            'eating_patterns': f"Analyzed {len(user.meal_analyses)} meals"
-        }
+    except Exception as e:
+        logger.error(f"Revolutionary analysis error: {str(e)}")
+        return jsonify({'error': f'Falha na análise: {str(e)}'}), 500
 
-        logger.info("🤖 Chamando Revolutionary AI Analysis...")
-        ai_response = call_advanced_food_ai(image_base64, user_context)
+NOT_FOOD_ERROR = 'The image you inserted is not food related.'
+XP_PER_ANALYSIS = 50
 
-        try:
-            ai_data = json.loads(ai_response) if ai_response.startswith('{') else get_revolutionary_mock_analysis()
-        except:
-            ai_data = get_revolutionary_mock_analysis()
+photo_dedup_stats = Counter()
+_photo_dedup_lock = threading.Lock()
 
-        nutrition = ai_data.get('nutrition', {})
-        revolutionary = ai_data.get('revolutionary_analysis', {})
-        health = ai_data.get('health_assessment', {})
+def _count_photo_dedup(name):
+    with _photo_dedup_lock:
+        photo_dedup_stats[name] += 1
 
-        calories = nutrition.get('calories', 0)
-        protein = nutrition.get('protein', 0)
-        carbs = nutrition.get('carbs', 0)
-        fat = nutrition.get('fat', 0)
-        fiber = nutrition.get('fiber', 0)
-        try:
-            calories = int(calories)
-            protein = float(protein)
-            carbs = float(carbs)
-            fat = float(fat)
-            fiber = float(fiber)
-        except:
-            calories, protein, carbs, fat, fiber = 0, 0.0, 0.0, 0.0, 0.0
+def find_duplicate_analysis(user_id, image_phash):
+    """Análise recente do utilizador cuja foto está a ``PHASH_MAX_DISTANCE`` bits ou menos."""
+    since = datetime.utcnow() - timedelta(seconds=app.config['PHASH_REUSE_WINDOW_SECONDS'])
+    recent = MealAnalysis.query.filter(
+        MealAnalysis.user_id == user_id,
+        MealAnalysis.created_at >= since
+    )
+    exact = recent.filter(MealAnalysis.image_phash == image_phash).order_by(MealAnalysis.created_at.desc()).first()
+    if exact:
+        return exact
 
-        emotional_score = revolutionary.get('emotional_score', 5.0)
-        addiction_risk = revolutionary.get('addiction_potential', 3.0)
-        satisfaction_pred = revolutionary.get('satisfaction_prediction', 7.0)
-        sleep_impact = revolutionary.get('sleep_impact', 0.0)
-        weight_impact = revolutionary.get('weight_impact_weekly', 0.0)
-        try:
-            emotional_score = float(emotional_score)
-            addiction_risk = float(addiction_risk)
-            satisfaction_pred = float(satisfaction_pred)
-            sleep_impact = float(sleep_impact)
-            weight_impact = float(weight_impact)
-        except:
-            emotional_score, addiction_risk, satisfaction_pred, sleep_impact, weight_impact = 5.0, 3.0, 7.0, 0.0, 0.0
+    max_distance = app.config['PHASH_MAX_DISTANCE']
+    if max_distance <= 0:
+        return None
+    candidates = recent.filter(MealAnalysis.image_phash.isnot(None)).order_by(MealAnalysis.created_at.desc())
+    for candidate in candidates:
+        if phash_distance(candidate.image_phash, image_phash) <= max_distance:
+            return candidate
+    return None
+
+def ai_data_from_meal_analysis(analysis):
+    """Reconstrói o resultado AI a partir de uma MealAnalysis gravada."""
+    return {
+        'is_food': True,
+        'foods_detected': json.loads(analysis.foods_detected or '[]'),
+        'nutrition': {
+            'calories': analysis.total_calories,
+            'protein': analysis.protein,
+            'carbs': analysis.carbs,
+            'fat': analysis.fat,
+            'fiber': analysis.fiber
+        },
+        'revolutionary_analysis': {
+            'emotional_score': analysis.emotional_food_score,
+            'addiction_potential': analysis.food_addiction_risk,
+            'satisfaction_prediction': analysis.predicted_satisfaction,
+            'energy_timeline': json.loads(analysis.energy_level_prediction or '[]'),
+            'sleep_impact': analysis.sleep_quality_impact,
+            'weight_impact_weekly': analysis.weight_impact_prediction,
+            'eating_personality': analysis.eating_personality_type,
+            'optimal_time': analysis.optimal_eating_time
+        },
+        'health_assessment': {
+            'score': analysis.health_score,
+            'obesity_risk': analysis.obesity_risk
+        },
+        'ai_insights': analysis.ai_feedback,
+        'suggestions': json.loads(analysis.suggestions or '[]')
+    }
 
-        health_score = health.get('score', 5.0)
-        try:
-            health_score = float(health_score)
-        except:
-            health_score = 5.0
+def reuse_duplicate_analysis(user_id, image_phash, force_reanalysis=False):
+    """Resultado AI de uma foto quase igual analisada há pouco, ou ``None``."""
+    if not image_phash:
+        return None
+    if force_reanalysis:
+        _count_photo_dedup('bypassed')
+        return None
+    duplicate = find_duplicate_analysis(user_id, image_phash)
+    if not duplicate:
+        _count_photo_dedup('misses')
+        return None
+    _count_photo_dedup('exact' if duplicate.image_phash == image_phash else 'near')
+    logger.info(f"♻️ Foto quase duplicada da análise {duplicate.id} - reaproveitando resultado AI")
+    ai_data = ai_data_from_meal_analysis(duplicate)
+    if duplicate.created_at >= datetime.utcnow() - timedelta(seconds=app.config['PHASH_BURST_WINDOW_SECONDS']):
+        _count_photo_dedup('burst')
+        ai_data['duplicate_of'] = duplicate.id
+    return ai_data
+
+def photo_dedup_report():
+    with _photo_dedup_lock:
+        stats = dict(photo_dedup_stats)
+    reused = stats.get('exact', 0) + stats.get('near', 0) + stats.get('batch', 0)
+    lookups = reused + stats.get('misses', 0)
+    return {
+        'lookups': lookups,
+        'reused': reused,
+        'exact': stats.get('exact', 0),
+        'near': stats.get('near', 0),
+        'batch_reused': stats.get('batch', 0),
+        'bypassed': stats.get('bypassed', 0),
+        'burst_not_logged': stats.get('burst', 0),
+        'reuse_rate': round(reused / lookups, 3) if lookups else 0.0,
+        'max_distance': app.config['PHASH_MAX_DISTANCE'],
+        'window_seconds': app.config['PHASH_REUSE_WINDOW_SECONDS']
+    }
 
-        # Use the health assessment score as the satisfaction prediction
-        satisfaction_pred = health_score
+def discard_upload(path):
+    """Apaga uma foto que não vai ser referenciada (ex.: imagem rejeitada) e os seus derivados."""
+    name = os.path.basename(path)
+    try:
+        blob_store.delete(name)
+        for size in app.config['IMAGE_DERIVATIVE_SIZES']:
+            for image_format in ('JPEG', 'WEBP'):
+                derivative_store.delete(image_derivative_name(name, size, image_format))
+    except OSError as e:
+        logger.error(f"❌ Erro ao apagar upload {path}: {e}")
+
+def build_user_context(user):
+    return {
+        'age': user.age,
+        'gender': user.gender,
+        'current_weight': user.current_weight,
+        'target_weight': user.target_weight,
+        'activity_level': user.activity_level,
+        'eating_patterns': f"Analyzed {len(user.meal_analyses)} meals"
+    }
 
-        meal_analysis = MealAnalysis(
-            user_id=user.id,
-            image_path=image_path,
-            foods_detected=json.dumps(ai_data.get('foods_detected', [])),
-            total_calories=calories,
-            protein=protein,
-            carbs=carbs,
-            fat=fat,
-            fiber=fiber,
-            emotional_food_score=emotional_score,
-            social_context=social_context,
-            food_addiction_risk=addiction_risk,
-            predicted_satisfaction=satisfaction_pred,
-            optimal_eating_time=revolutionary.get('optimal_time', '12:00-14:00'),
-            eating_personality_type=revolutionary.get('eating_personality', 'Balanced'),
-            mood_before_eating=mood_before,
-            mood_after_eating='content',
-            weight_impact_prediction=weight_impact,
-            energy_level_prediction=json.dumps(revolutionary.get('energy_timeline', [])),
-            sleep_quality_impact=sleep_impact,
-            health_score=health_score,
-            obesity_risk=health.get('obesity_risk', 'moderate'),
-            ai_feedback=ai_data.get('ai_insights', 'Analysis completed'),
-            suggestions=json.dumps(ai_data.get('suggestions', [])),
-            meal_type=meal_type
-        )
-        db.session.add(meal_analysis)
-
-        # Atualiza XP e streak
-        user.total_xp += 50
-        user.level = calculate_advanced_level(user.total_xp)
-        now = datetime.utcnow()
-        yesterday = now - timedelta(days=1)
-        if user.last_activity and user.last_activity.date() == yesterday.date():
-            user.streak_days += 1
-        elif not user.last_activity or user.last_activity.date() != now.date():
-            user.streak_days = 1
-        user.last_activity = now
-
-        if len(user.meal_analyses) >= 4 and not user.dna_food_profile:
-            dna_profile = generate_food_dna_profile(user.meal_analyses)
-            user.dna_food_profile = json.dumps(dna_profile)
+def run_meal_ai_analysis(image_bytes, user_context, force_reanalysis=False):
+    """Executa a análise AI da foto; devolve ``None`` se não for comida."""
+    # No modo single-pass o gate de comida vem na própria análise
+    single_pass = app.config['AI_SINGLE_PASS_ANALYSIS']
+    if not single_pass and not is_food_image(image_bytes):
+        return None
 
-        db.session.commit()
+    logger.info("🤖 Chamando Revolutionary AI Analysis...")
+    ai_response = call_advanced_food_ai(image_bytes, user_context, bypass_cache=force_reanalysis)
+
+    try:
+        ai_data = json.loads(ai_response) if ai_response.startswith('{') else get_revolutionary_mock_analysis()
+    except:
+        ai_data = get_revolutionary_mock_analysis()
+
+    if single_pass and (ai_data.get('is_food') is False or not ai_data.get('foods_detected')):
+        return None
+    return ai_data
+
+def add_meal_analysis(user, ai_data, image_path, options):
+    """Adiciona à sessão a MealAnalysis e as atualizações de XP/streak/FoodMemory (sem commit)."""
+    nutrition = ai_data.get('nutrition', {})
+    revolutionary = ai_data.get('revolutionary_analysis', {})
+    health = ai_data.get('health_assessment', {})
+
+    calories = nutrition.get('calories', 0)
+    protein = nutrition.get('protein', 0)
+    carbs = nutrition.get('carbs', 0)
+    fat = nutrition.get('fat', 0)
+    fiber = nutrition.get('fiber', 0)
+    try:
+        calories = int(calories)
+        protein = float(protein)
+        carbs = float(carbs)
+        fat = float(fat)
+        fiber = float(fiber)
+    except:
+        calories, protein, carbs, fat, fiber = 0, 0.0, 0.0, 0.0, 0.0
+
+    emotional_score = revolutionary.get('emotional_score', 5.0)
+    addiction_risk = revolutionary.get('addiction_potential', 3.0)
+    satisfaction_pred = revolutionary.get('satisfaction_prediction', 7.0)
+    sleep_impact = revolutionary.get('sleep_impact', 0.0)
+    weight_impact = revolutionary.get('weight_impact_weekly', 0.0)
+    try:
+        emotional_score = float(emotional_score)
+        addiction_risk = float(addiction_risk)
+        satisfaction_pred = float(satisfaction_pred)
+        sleep_impact = float(sleep_impact)
+        weight_impact = float(weight_impact)
+    except:
+        emotional_score, addiction_risk, satisfaction_pred, sleep_impact, weight_impact = 5.0, 3.0, 7.0, 0.0, 0.0
+
+    health_score = health.get('score', 5.0)
+    try:
+        health_score = float(health_score)
+    except:
+        health_score = 5.0
+
+    # Use the health assessment score as the satisfaction prediction
+    satisfaction_pred = health_score
+
+    meal_analysis = MealAnalysis(
+        user_id=user.id,
+        image_path=image_path,
+        foods_detected=json.dumps(ai_data.get('foods_detected', [])),
+        total_calories=calories,
+        protein=protein,
+        carbs=carbs,
+        fat=fat,
+        fiber=fiber,
+        emotional_food_score=emotional_score,
+        social_context=options['social_context'],
+        food_addiction_risk=addiction_risk,
+        predicted_satisfaction=satisfaction_pred,
+        optimal_eating_time=revolutionary.get('optimal_time', '12:00-14:00'),
+        eating_personality_type=revolutionary.get('eating_personality', 'Balanced'),
+        mood_before_eating=options['mood_before'],
+        mood_after_eating='content',
+        weight_impact_prediction=weight_impact,
+        energy_level_prediction=json.dumps(revolutionary.get('energy_timeline', [])),
+        sleep_quality_impact=sleep_impact,
+        health_score=health_score,
+        obesity_risk=health.get('obesity_risk', 'moderate'),
+        ai_feedback=ai_data.get('ai_insights', 'Analysis completed'),
+        suggestions=json.dumps(ai_data.get('suggestions', [])),
+        meal_type=options['meal_type'],
+        image_phash=options.get('image_phash')
+    )
+    db.session.add(meal_analysis)
+
+    # Atualiza XP e streak
+    user.total_xp += XP_PER_ANALYSIS
+    user.level = calculate_advanced_level(user.total_xp)
+    now = datetime.utcnow()
+    yesterday = now - timedelta(days=1)
+    if user.last_activity and user.last_activity.date() == yesterday.date():
+        user.streak_days += 1
+    elif not user.last_activity or user.last_activity.date() != now.date():
+        user.streak_days = 1
+    user.last_activity = now
+
+    # As memórias entram na mesma transação que a análise
+    update_food_memories(user.id, ai_data.get('foods_detected', []), meal_analysis)
+    return meal_analysis
+
+def update_dna_profile(user):
+    if len(user.meal_analyses) >= 4 and not user.dna_food_profile:
+        dna_profile = generate_food_dna_profile(user.meal_analyses)
+        user.dna_food_profile = json.dumps(dna_profile)
+
+def suggest_meal_title(ai_data, user_id=None):
+    foods = ai_data.get('foods_detected', [])
+    return generate_meal_title(", ".join(foods), user_id=user_id) if foods else None
+
+def meal_analysis_summary(ai_data, title):
+    revolutionary = ai_data.get('revolutionary_analysis', {})
+    return {
+        'title': title,
+        'foods_detected': ai_data.get('foods_detected', []),
+        'nutrition': ai_data.get('nutrition', {}),
+        'revolutionary_insights': {
+            'emotional_score': revolutionary.get('emotional_score'),
+            'addiction_risk': revolutionary.get('addiction_potential'),
+            'satisfaction_prediction': revolutionary.get('satisfaction_prediction'),
+            'energy_timeline': revolutionary.get('energy_timeline'),
+            'sleep_impact': revolutionary.get('sleep_impact'),
+            'weight_impact': revolutionary.get('weight_impact_weekly'),
+            'personality_type': revolutionary.get('eating_personality'),
+            'optimal_time': revolutionary.get('optimal_time')
+        },
+        'health_assessment': ai_data.get('health_assessment', {}),
+        'ai_feedback': ai_data.get('ai_insights'),
+        'suggestions': ai_data.get('suggestions')
+    }
+
+def save_meal_analysis(user, ai_data, image_path, options):
+    """Grava a MealAnalysis, atualiza XP/streak/DNA e devolve o corpo da resposta.
+    Uma foto da mesma rajada (``duplicate_of``) não é gravada nem dá XP."""
+    if ai_data.get('duplicate_of'):
+        discard_upload(image_path)
+        return {
+            'analysis': meal_analysis_summary(ai_data, suggest_meal_title(ai_data, user.id)),
+            'duplicate_of': ai_data['duplicate_of'],
+            'xp_gained': 0,
+            'new_total_xp': user.total_xp,
+            'new_level': user.level,
+            'streak_days': user.streak_days,
+            'new_badges': [],
+            'dna_unlocked': False
+        }
+    add_meal_analysis(user, ai_data, image_path, options)
+    update_dna_profile(user)
+    db.session.commit()
 
-        new_badges = check_revolutionary_badges(user)
-        update_food_memories(user.id, ai_data.get('foods_detected', []), meal_analysis)
+    new_badges = check_revolutionary_badges(user)
+    return {
+        'analysis': meal_analysis_summary(ai_data, suggest_meal_title(ai_data, user.id)),
+        'xp_gained': XP_PER_ANALYSIS,
+        'new_total_xp': user.total_xp,
+        'new_level': user.level,
+        'streak_days': user.streak_days,
+        'new_badges': new_badges,
+        'dna_unlocked': bool(user.dna_food_profile and len(user.meal_analyses) == 5)
+    }
 
-        foods = ai_data.get('foods_detected', [])
-        suggested_title = generate_meal_title(", ".join(foods)) if foods else None
+def run_meal_analysis_job(job, payload):
+    """Handler da fila de jobs: análise de uma foto já gravada em disco."""
+    user = User.query.get(job.user_id)
+    if not user:
+        raise RuntimeError('Utilizador não encontrado')
+
+    with open(payload['image_path'], 'rb') as fh:
+        image_bytes = fh.read()
+
+    force_reanalysis = payload.get('force_reanalysis', False)
+    ai_data = reuse_duplicate_analysis(user.id, payload.get('image_phash'), force_reanalysis) \
+        or run_meal_ai_analysis(image_bytes, build_user_context(user), force_reanalysis)
+    if ai_data is None:
+        discard_upload(payload['image_path'])
+        raise ValueError(NOT_FOOD_ERROR)
+    return save_meal_analysis(user, ai_data, payload['image_path'], payload)
+
+def map_bounded(fn, items, max_in_flight):
+    """Corre ``fn(item)`` no ai_executor com no máximo ``max_in_flight`` chamadas
+    em curso. Devolve ``(resultado, erro)`` por item, na ordem original."""
+    outcomes = [None] * len(items)
+    pending = {}
+    next_index = 0
+    while next_index < len(items) or pending:
+        while next_index < len(items) and len(pending) < max_in_flight:
+            pending[ai_executor.submit(fn, items[next_index])] = next_index
+            next_index += 1
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            index = pending.pop(future)
+            try:
+                outcomes[index] = (future.result(), None)
+            except Exception as e:
+                outcomes[index] = (None, e)
+    return outcomes
+
+# ------------------------
+# ANÁLISE EM LOTE (POST)
+# ------------------------
+# Várias fotos num só pedido: as chamadas AI correm em paralelo (limitadas
+# por ANALYSIS_BATCH_CONCURRENCY) e todas as análises, XP e FoodMemory são
+# gravadas numa única transação. Falhas por imagem não invalidam o lote.
+@app.route('/api/analyze-revolutionary/batch', methods=['POST'])
+def analyze_meal_batch():
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({'error': 'Autenticação necessária'}), 401
+
+        image_files = request.files.getlist('images')
+        if not image_files:
+            return jsonify({'error': 'Pelo menos uma imagem é obrigatória'}), 400
+        max_images = app.config['ANALYSIS_BATCH_MAX_IMAGES']
+        if len(image_files) > max_images:
+            return jsonify({'error': f'Máximo de {max_images} imagens por lote'}), 400
+
+        options = {
+            'meal_type': request.form.get('meal_type', 'unknown'),
+            'mood_before': request.form.get('mood_before', 'neutral'),
+            'social_context': request.form.get('social_context', 'alone'),
+            'force_reanalysis': request.form.get('force_reanalysis', 'false').lower() in ('1', 'true', 'yes')
+        }
+        user_context = build_user_context(user)
+
+        results = []
+        items = []
+        for index, image_file in enumerate(image_files):
+            results.append({'index': index, 'filename': image_file.filename})
+            image_path = blob_store.writable_path(f"{uuid.uuid4()}.jpg")
+            try:
+                prepared = load_upload_for_ai(image_file, save_path=image_path)
+            except InvalidImageError as e:
+                results[index].update(status='failed', error=f'Imagem inválida: {str(e)}')
+                continue
+            items.append((index, image_path, prepared['jpeg'], compute_image_phash(prepared['image'])))
+
+        # Fotos quase iguais dentro do lote (rajadas) só vão uma vez ao GPT-4o
+        leaders = []
+        leader_of = {}
+        for position, (_, _, _, image_phash) in enumerate(items):
+            for leader in leaders:
+                if phash_distance(items[leader][3], image_phash) <= app.config['PHASH_MAX_DISTANCE']:
+                    leader_of[position] = leader
+                    break
+            else:
+                leaders.append(position)
+
+        def analyze_item(item):
+            _, _, image_bytes, image_phash = item
+            with app.app_context():
+                ai_data = reuse_duplicate_analysis(user_id, image_phash, options['force_reanalysis']) \
+                    or run_meal_ai_analysis(image_bytes, user_context, options['force_reanalysis'])
+                if ai_data is None:
+                    raise ValueError(NOT_FOOD_ERROR)
+                return ai_data, suggest_meal_title(ai_data, user_id)
+
+        user_id = user.id
+        leader_outcomes = map_bounded(analyze_item, [items[p] for p in leaders], app.config['ANALYSIS_BATCH_CONCURRENCY'])
+        outcome_by_position = dict(zip(leaders, leader_outcomes))
+        outcomes = []
+        for position in range(len(items)):
+            if position in leader_of:
+                _count_photo_dedup('batch')
+                outcomes.append(outcome_by_position[leader_of[position]])
+            else:
+                outcomes.append(outcome_by_position[position])
+
+        analyzed = []
+        duplicates = 0
+        for position, ((index, image_path, _, image_phash), (outcome, error)) in enumerate(zip(items, outcomes)):
+            if error:
+                if not isinstance(error, ValueError):
+                    logger.error(f"❌ Erro na análise em lote (imagem {index}): {error}")
+                discard_upload(image_path)
+                results[index].update(status='failed', error=str(error))
+                continue
+            ai_data, title = outcome
+            # Rajada (dentro do lote ou de uma análise de há pouco): mostra o resultado sem gravar nem dar XP
+            if position in leader_of or ai_data.get('duplicate_of'):
+                discard_upload(image_path)
+                results[index].update(status='duplicate', analysis=meal_analysis_summary(ai_data, title))
+                duplicates += 1
+                continue
+            add_meal_analysis(user, ai_data, image_path, dict(options, image_phash=image_phash))
+            results[index].update(status='done', analysis=meal_analysis_summary(ai_data, title))
+            analyzed.append(index)
+
+        new_badges = []
+        if analyzed:
+            update_dna_profile(user)
+            db.session.commit()
+            new_badges = check_revolutionary_badges(user)
 
         return jsonify({
-            'analysis': {
-                'title': suggested_title,
-                'foods_detected': ai_data.get('foods_detected', []),
-                'nutrition': nutrition,
-                'revolutionary_insights': {
-                    'emotional_score': revolutionary.get('emotional_score'),
-                    'addiction_risk': revolutionary.get('addiction_potential'),
-                    'satisfaction_prediction': revolutionary.get('satisfaction_prediction'),
-                    'energy_timeline': revolutionary.get('energy_timeline'),
-                    'sleep_impact': revolutionary.get('sleep_impact'),
-                    'weight_impact': revolutionary.get('weight_impact_weekly'),
-                    'personality_type': revolutionary.get('eating_personality'),
-                    'optimal_time': revolutionary.get('optimal_time')
-                },
-                'health_assessment': health,
-                'ai_feedback': ai_data.get('ai_insights'),
-                'suggestions': ai_data.get('suggestions')
-            },
-            'xp_gained': 50,
+            'results': results,
+            'analyzed': len(analyzed),
+            'duplicates': duplicates,
+            'failed': len(results) - len(analyzed) - duplicates,
+            'xp_gained': XP_PER_ANALYSIS * len(analyzed),
             'new_total_xp': user.total_xp,
             'new_level': user.level,
             'streak_days': user.streak_days,
             'new_badges': new_badges,
-            'dna_unlocked': bool(user.dna_food_profile and len(user.meal_analyses) == 5)
-        }), 200
+            'dna_unlocked': bool(analyzed and user.dna_food_profile and len(user.meal_analyses) == 5)
+        }), 200 if analyzed or duplicates else 400
 
     except Exception as e:
-        logger.error(f"Revolutionary analysis error: {str(e)}")
+        db.session.rollback()
+        logger.error(f"Batch analysis error: {str(e)}")
         return jsonify({'error': f'Falha na análise: {str(e)}'}), 500
 
 def update_food_memories(user_id, foods, analysis):
@@ -1924,15 +4096,14 @@ def detect_ingredients():
         return jsonify({'error': 'Nenhuma imagem enviada'}), 400
 
     try:
-        # Ler a imagem e converter para base64
-        img_file = request.files['image']
-        img = Image.open(img_file.stream)
-        buf = io.BytesIO()
-        img.save(buf, format='JPEG')
-        img_base64 = base64.b64encode(buf.getvalue()).decode()
+        # Ler a imagem e normalizar para JPEG
+        try:
+            image_bytes = load_upload_for_ai(request.files['image'])['jpeg']
+        except InvalidImageError as e:
+            return jsonify({'error': f'Imagem inválida: {str(e)}'}), 400
 
         # Chamar o helper que fala com o GPT-4o
-        ingredientes = detect_ingredients_from_image(img_base64)
+        ingredientes = detect_ingredients_from_image(image_bytes)
 
         return jsonify({'detected_ingredients': ingredientes}), 200
 
@@ -1953,17 +4124,16 @@ def generate_recipe_endpoint():
         # Detectamos ingredientes da imagem, se houver
         image_ingredients = []
         if 'image' in request.files:
-            img_file = request.files['image']
-            img = Image.open(img_file.stream)
-            buf = io.BytesIO()
-            img.save(buf, format='JPEG')
-            img_base64 = base64.b64encode(buf.getvalue()).decode()
-            image_ingredients = detect_ingredients_from_image(img_base64)
-
-            if not is_food_image(img_base64):
+            try:
+                image_bytes = load_upload_for_ai(request.files['image'])['jpeg']
+            except InvalidImageError as e:
+                return jsonify({'error': f'Imagem inválida: {str(e)}'}), 400
+
+            if not is_food_image(image_bytes):
                 return jsonify({'error': 'The image you inserted is not food related.'}), 400
 
-            image_ingredients = detect_ingredients_from_image(img_base64)
+            # Memoizado: reaproveita a detecção já feita pelo gate acima
+            image_ingredients = detect_ingredients_from_image(image_bytes)
 
         # Agora lemos os parâmetros restantes
         if request.is_json:
@@ -2003,9 +4173,10 @@ def generate_recipe_endpoint():
                 f"Ingredientes possivelmente inválidos: {validation_result['invalid_items']}"
             )
 
-        # Usa o GPT para filtrar itens não alimentares
-        filtered = ai_filter_food_items(validation_result['valid_items'])
-        translated_ingredients = translate_ingredients_to_english(filtered)
+        # Filtra itens não alimentares (localmente; o GPT só vê os indecisos)
+        filtered = filter_food_items(validation_result['valid_items'])
+        parsed_ingredients = [translate_ingredient(item) for item in filtered]
+        translated_ingredients = [item['name'] for item in parsed_ingredients]
 
         preferences = {
             'meal_type': meal_type,
@@ -2019,17 +4190,25 @@ def generate_recipe_endpoint():
             user, translated_ingredients, preferences, count=3
         )
 
-        # Garante imagem para cada opção gerada
-        for opt in recipe_options:
-            if not opt.get('image_url'):
-                prompt = f"{opt['title']} plated meal, professional food photography"
-                opt['image_url'] = generate_recipe_image_url(prompt)
+        # Garante imagem para cada opção gerada (em paralelo ou num job em background)
+        missing = [opt for opt in recipe_options if not opt.get('image_url')]
+        prompts = [recipe_image_prompt(opt['title']) for opt in missing]
+        image_job_id = None
+        if missing and data.get('defer_images'):
+            image_job_id = submit_recipe_image_job(user.id, prompts)
+            for opt in missing:
+                opt['image_url'] = RECIPE_IMAGE_PLACEHOLDER
+        else:
+            for opt, url in zip(missing, generate_recipe_images(prompts)):
+                opt['image_url'] = url
 
         return jsonify({
             'detected_from_image': image_ingredients,
             'validation_result': validation_result,
+            'parsed_ingredients': parsed_ingredients,
             'recipe_options': recipe_options,
-            'personalization_applied': preferences
+            'personalization_applied': preferences,
+            'image_job_id': image_job_id
         }), 201
 
     except Exception as e:
@@ -2053,9 +4232,10 @@ def save_recipe():
 
     try:
         image_url = data.get('image_url')
-        if not image_url:
-            prompt = f"{title} plated meal, professional food photography"
-            image_url = generate_recipe_image_url(prompt)
+        # O placeholder das opções geradas nunca é gravado, nem uma imagem que o
+        # gc-uploads já apagou: a imagem fica por gerar e o backfill trata dela
+        if image_url == RECIPE_IMAGE_PLACEHOLDER or not blob_store.url_exists(image_url):
+            image_url = None
 
         recipe_saved = RecipeCollection(
             user_id=user.id,
@@ -2079,8 +4259,13 @@ def save_recipe():
         )
         db.session.add(recipe_saved)
         db.session.commit()
+        if recipe_image_due(recipe_saved):
+            enqueue_recipe_image_backfill(recipe_saved.id)
         logger.info(f"✅ Receita salva para o usuário {user.id}: {recipe_saved.id}")
-        return jsonify({'recipe_id': recipe_saved.id}), 201
+        return jsonify({
+            'recipe_id': recipe_saved.id,
+            'image_status': recipe_image_status(recipe_saved)
+        }), 201
     except Exception as e:
         logger.error(f"❌ Erro ao salvar receita: {str(e)}")
         db.session.rollback()
@@ -2104,10 +4289,8 @@ def get_user_recipes():
         recipes = query.order_by(RecipeCollection.created_at.desc()).all()
         recipes_data = []
         for recipe in recipes:
-            if not recipe.image_url:
-                prompt = f"{recipe.title} plated meal, professional food photography"
-                recipe.image_url = generate_recipe_image_url(prompt)
-                db.session.commit()
+            if recipe_image_due(recipe):
+                enqueue_recipe_image_backfill(recipe.id)
             recipes_data.append({
                 'id': recipe.id,
                 'title': recipe.title,
@@ -2123,7 +4306,8 @@ def get_user_recipes():
                 'difficulty': recipe.difficulty,
                 'tags': json.loads(recipe.tags or '[]'),
                 # ← Aqui adicionamos a linha “image_url”
-                'image_url': recipe.image_url,
+                'image_url': recipe.image_url or RECIPE_IMAGE_PLACEHOLDER,
+                'image_status': recipe_image_status(recipe),
                 'matches_dna': recipe.matches_dna,
                 'personalization_score': recipe.personalization_score,
                 'created_at': recipe.created_at.isoformat()
@@ -2151,10 +4335,8 @@ def get_recipe_details(recipe_id):
         if not recipe:
             return jsonify({'error': 'Receita não encontrada'}), 404
 
-        if not recipe.image_url:
-            prompt = f"{recipe.title} plated meal, professional food photography"
-            recipe.image_url = generate_recipe_image_url(prompt)
-            db.session.commit()
+        if recipe_image_due(recipe):
+            enqueue_recipe_image_backfill(recipe.id)
 
         recipe_data = {
             'id': recipe.id,
@@ -2177,7 +4359,8 @@ def get_recipe_details(recipe_id):
             'matches_dna': recipe.matches_dna,
             'personalization_score': recipe.personalization_score,
             # ← Aqui também incluímos “image_url” nos detalhes
-            'image_url': recipe.image_url,
+            'image_url': recipe.image_url or RECIPE_IMAGE_PLACEHOLDER,
+            'image_status': recipe_image_status(recipe),
             'created_at': recipe.created_at.isoformat()
         }
         return jsonify({'recipe': recipe_data}), 200
@@ -2439,11 +4622,14 @@ def upload_profile_photo():
 
     file = request.files['photo']
     filename = f"{uuid.uuid4()}.jpg"
-    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(path)
+    file.save(blob_store.writable_path(filename))
+    previous_photo = user.profile_photo
     user.profile_photo = filename
     db.session.commit()
-    return jsonify({'photo_url': f'/api/images/{filename}'}), 200
+    # A foto anterior deixou de ser referenciada
+    if previous_photo:
+        discard_upload(previous_photo)
+    return jsonify({'photo_url': blob_store.url(filename)}), 200
 
 # ------------------------
 # SUGESTÕES DE REFEIÇÃO (GET)
@@ -2547,9 +4733,11 @@ def get_meal_history():
         for analysis in analyses.items:
             # Gerar URL da imagem se existir
             image_url = None
-            if analysis.image_path and os.path.exists(analysis.image_path):
+            thumbnail_url = None
+            if analysis.image_path and blob_store.exists(os.path.basename(analysis.image_path)):
                 # Assumindo que você tem um endpoint para servir imagens
                 image_url = f"/api/images/{os.path.basename(analysis.image_path)}"
+                thumbnail_url = f"{image_url}?size=128"
             
             history_data.append({
                 'id': analysis.id,
@@ -2565,6 +4753,7 @@ def get_meal_history():
                 'meal_type': analysis.meal_type,
                 'created_at': analysis.created_at.isoformat(),
                 'image_url': image_url,  # ADICIONADO
+                'thumbnail_url': thumbnail_url,
                 'ai_feedback': analysis.ai_feedback,  # ADICIONADO
                 'suggestions': analysis.suggestions  # ADICIONADO
             })
@@ -2600,15 +4789,13 @@ def delete_meal_history(analysis_id):
         if analysis.user_id != user.id:
             return jsonify({'error': 'Não autorizado'}), 403
 
-        if analysis.image_path and os.path.exists(analysis.image_path):
-            try:
-                os.remove(analysis.image_path)
-            except OSError:
-                pass
-
+        image_path = analysis.image_path
         db.session.delete(analysis)
         db.session.commit()
 
+        if image_path:
+            discard_upload(image_path)
+
         return jsonify({'message': 'Análise removida'}), 200
     except Exception as e:
         logger.error(f"❌ Erro ao excluir análise: {str(e)}")
@@ -2760,15 +4947,21 @@ def add_daily_meal():
         meal_name = data.get('name')
         if not meal_name:
             if description:
-                meal_name = generate_meal_title(description)
+                meal_name = generate_meal_title(description, user_id=user.id)
             else:
                 meal_name = f"{data['meal_type'].title()} {data['time']}"
 
         if estimate_flag:
             text_for_estimate = description or meal_name
-            estimates = estimate_nutrition_from_text(text_for_estimate)
+            estimates = estimate_nutrition_from_text(text_for_estimate, user_id=user.id)
             if not estimates:
                 return jsonify({'error': 'Falha na estimativa nutricional'}), 500
+            # Só a parte local foi estimada: não se grava como se fosse a refeição toda
+            if estimates.get('partial'):
+                return jsonify({
+                    'error': 'Estimativa nutricional incompleta',
+                    'partial_estimate': estimates
+                }), 500
             calories = estimates['calories']
             protein = estimates['protein']
             carbs = estimates['carbs']
@@ -2945,18 +5138,29 @@ def add_weight_progress():
 # ------------------------
 # GERAÇÃO DE IMAGEM DE RECEITA
 # ------------------------
+RECIPE_IMAGE_PLACEHOLDER = "https://via.placeholder.com/1024"
 
-def generate_recipe_image_url(prompt):
-    """Gera uma URL de imagem usando o Azure DALL·E. Em caso de falha retorna
-    um placeholder."""
+recipe_image_cache = SingleFlightCache(
+    'recipe_images',
+    max_entries=app.config['RECIPE_IMAGE_CACHE_MAX_ENTRIES'],
+    cacheable=lambda url: bool(url) and url.startswith('/api/images/')
+)
+
+def recipe_image_prompt(title):
+    return f"{title} plated meal, professional food photography"
+
+
+def request_dalle_image_url(prompt):
+    """Pede uma imagem ao Azure DALL·E e devolve a URL remota (temporária) ou
+    ``None`` em caso de falha."""
     try:
         if client is None:
             logger.warning("Azure DALL·E client unavailable - using placeholder image")
             raise RuntimeError("offline")
-        AZURE_ENDPOINT = "https://inaop-m8ohnn6q-swedencentral.openai.azure.com"
-        DEPLOYMENT_NAME = "dall-e-3"
-        API_VERSION = "2024-02-01"
-        AZURE_API_KEY = "ClLQh4NwuGDphJEiuoMCzvjAibamC88Kpi7yNfoliMEpl061SFxqJQQJ99BCACfhMk5XJ3w3AAAAACOGluow"
+        AZURE_ENDPOINT = app.config['AZURE_DALLE_ENDPOINT'].rstrip('/')
+        DEPLOYMENT_NAME = app.config['AZURE_DALLE_DEPLOYMENT']
+        API_VERSION = app.config['AZURE_DALLE_API_VERSION']
+        AZURE_API_KEY = app.config['AZURE_DALLE_KEY']
 
         url = f"{AZURE_ENDPOINT}/openai/deployments/{DEPLOYMENT_NAME}/images/generations?api-version={API_VERSION}"
         headers = {
@@ -2972,17 +5176,275 @@ def generate_recipe_image_url(prompt):
             "n": 1,
         }
 
-        resp = requests.post(url, headers=headers, json=payload, timeout=30)
+        def post_generation():
+            resp = ai_http_session.post(
+                url, headers=headers, json=payload,
+                timeout=app.config['AI_IMAGE_TIMEOUT_SECONDS']
+            )
+            if resp.status_code in RETRYABLE_STATUS_CODES:
+                raise UpstreamHTTPError(resp)
+            return resp
+
+        resp = image_upstream.call(post_generation)
         if resp.status_code != 200:
             logger.error(f"Erro ao chamar Azure DALL·E: {resp.status_code} {resp.text}")
-            return "https://via.placeholder.com/1024"
+            return None
 
         result = resp.json()
         if isinstance(result, dict) and "data" in result and isinstance(result["data"], list) and result["data"]:
-            return result["data"][0].get("url", "https://via.placeholder.com/1024")
+            return result["data"][0].get("url")
     except Exception as e:
         logger.error(f"Erro na geração da imagem: {e}")
-    return "https://via.placeholder.com/1024"
+    return None
+
+def normalize_image_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+def recipe_image_blob_name(prompt):
+    digest = hashlib.sha256(normalize_image_prompt(prompt).encode('utf-8')).hexdigest()
+    return f"recipe-{digest}.jpg"
+
+def generate_recipe_image_url(prompt):
+    """Devolve a URL da imagem do prompt. Pedidos concorrentes pelo mesmo
+    prompt normalizado partilham uma única geração."""
+    key = normalize_image_prompt(prompt)
+    url = recipe_image_cache.get_or_compute(key, lambda: create_recipe_image(prompt))
+    # A imagem pode ter sido apagada pelo gc-uploads depois de entrar na cache
+    if not blob_store.url_exists(url):
+        recipe_image_cache.discard(key)
+        url = recipe_image_cache.get_or_compute(key, lambda: create_recipe_image(prompt))
+    return url
+
+def create_recipe_image(prompt):
+    """Devolve a URL local da imagem do prompt, gerando-a no Azure DALL·E só
+    quando ainda não existe no blob store. Em caso de falha retorna um
+    placeholder."""
+    blob_name = recipe_image_blob_name(prompt)
+    if blob_store.exists(blob_name):
+        return blob_store.url(blob_name)
+
+    remote_url = request_dalle_image_url(prompt)
+    if not remote_url:
+        return RECIPE_IMAGE_PLACEHOLDER
+
+    # As URLs do DALL·E expiram: descarregamos uma vez e guardamos em JPEG
+    try:
+        resp = ai_http_session.get(remote_url, timeout=app.config['AI_IMAGE_TIMEOUT_SECONDS'])
+        resp.raise_for_status()
+        image = Image.open(io.BytesIO(resp.content)).convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=app.config['RECIPE_IMAGE_JPEG_QUALITY'], optimize=True)
+        blob_store.put(blob_name, buffer.getvalue())
+        return blob_store.url(blob_name)
+    except Exception as e:
+        # A URL do DALL·E expira: devolve o placeholder para o backfill tentar de novo
+        logger.error(f"Erro ao guardar imagem gerada: {e}")
+        return RECIPE_IMAGE_PLACEHOLDER
+
+def generate_recipe_images(prompts):
+    """Gera as imagens de vários prompts em paralelo, mantendo a ordem."""
+    futures = [ai_executor.submit(generate_recipe_image_url, prompt) for prompt in prompts]
+    concurrent.futures.wait(futures, timeout=app.config['RECIPE_IMAGE_DEADLINE_SECONDS'])
+
+    urls = []
+    for future in futures:
+        if future.done() and not future.exception():
+            urls.append(future.result())
+        else:
+            future.cancel()
+            urls.append(RECIPE_IMAGE_PLACEHOLDER)
+    return urls
+
+def submit_recipe_image_job(user_id, prompts):
+    """Enfileira um job que gera as imagens fora do request; devolve o job id."""
+    return enqueue_background_job(user_id, 'recipe_images', {'prompts': prompts})
+
+def run_recipe_image_job(job, payload):
+    return {'image_urls': generate_recipe_images(payload['prompts'])}
+
+# ------------------------
+# FILA DE JOBS EM BACKGROUND (SQLite)
+# ------------------------
+# Os jobs ficam na tabela background_job: sobrevivem a restarts e qualquer
+# worker reclama um job pendente com um UPDATE condicional, sem broker externo.
+_job_wakeup = threading.Event()
+_job_workers = []
+_job_workers_lock = threading.Lock()
+BACKGROUND_JOB_CLAIM_BATCH = 5
+
+def enqueue_background_job(user_id, kind, payload):
+    job = BackgroundJob(user_id=user_id, kind=kind, payload=json.dumps(payload))
+    db.session.add(job)
+    db.session.commit()
+    start_background_job_workers()
+    _job_wakeup.set()
+    return job.id
+
+def start_background_job_workers():
+    with _job_workers_lock:
+        _job_workers[:] = [t for t in _job_workers if t.is_alive()]
+        while len(_job_workers) < app.config['BACKGROUND_JOB_WORKERS']:
+            worker = threading.Thread(
+                target=background_job_worker,
+                name=f"nutrivision-jobs-{len(_job_workers)}",
+                daemon=True
+            )
+            worker.start()
+            _job_workers.append(worker)
+
+def claim_next_background_job():
+    """Passa o job pendente mais antigo a 'running'; devolve-o, ou None se a fila estiver vazia."""
+    stale_before = datetime.utcnow() - timedelta(seconds=app.config['JOB_STALE_SECONDS'])
+    BackgroundJob.query.filter(
+        BackgroundJob.status == 'running',
+        BackgroundJob.updated_at < stale_before
+    ).update({'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+
+    candidates = db.session.query(BackgroundJob.id).filter_by(status='pending') \
+        .order_by(BackgroundJob.created_at).limit(BACKGROUND_JOB_CLAIM_BATCH).all()
+    for (job_id,) in candidates:
+        # Só um worker consegue mudar pending -> running
+        claimed = BackgroundJob.query.filter_by(id=job_id, status='pending').update(
+            {'status': 'running', 'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+        if claimed:
+            return BackgroundJob.query.get(job_id)
+    return None
+
+def background_job_heartbeat(job_id, stop):
+    """Atualiza updated_at enquanto o job corre, para não ser dado como morto
+    e corrido outra vez (XP e MealAnalysis em duplicado)."""
+    while not stop.wait(app.config['JOB_HEARTBEAT_SECONDS']):
+        try:
+            with app.app_context():
+                BackgroundJob.query.filter_by(id=job_id, status='running').update(
+                    {'updated_at': datetime.utcnow()}, synchronize_session=False
+                )
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"❌ Erro no heartbeat do job {job_id}: {e}")
+
+def run_background_job(job):
+    job_id = job.id
+    stop_heartbeat = threading.Event()
+    threading.Thread(
+        target=background_job_heartbeat, args=(job_id, stop_heartbeat),
+        name=f"nutrivision-job-heartbeat-{job_id}", daemon=True
+    ).start()
+    try:
+        handler = JOB_HANDLERS[job.kind]
+        payload = json.loads(job.payload) if job.payload else {}
+        result = handler(job, payload)
+        job.result = json.dumps(result)
+        job.status = 'done'
+    except Exception as e:
+        logger.error(f"❌ Erro no job {job.kind} {job_id}: {e}")
+        db.session.rollback()
+        job = BackgroundJob.query.get(job_id)
+        job.status = 'failed'
+        job.error = str(e)
+    finally:
+        stop_heartbeat.set()
+    db.session.commit()
+
+def background_job_worker():
+    while True:
+        try:
+            with app.app_context():
+                job = claim_next_background_job()
+                if job:
+                    run_background_job(job)
+                    continue
+        except Exception as e:
+            logger.error(f"❌ Erro no worker de jobs: {e}")
+        _job_wakeup.wait(timeout=app.config['JOB_POLL_INTERVAL_SECONDS'])
+        _job_wakeup.clear()
+
+JOB_HANDLERS = {
+    'meal_analysis': run_meal_analysis_job,
+    'recipe_images': run_recipe_image_job,
+}
+
+@app.before_request
+def ensure_background_job_workers():
+    # Com gunicorn o __main__ não corre: os workers arrancam no primeiro request
+    # e retomam os jobs pendentes da execução anterior
+    if not _job_workers:
+        start_background_job_workers()
+
+# ------------------------
+# BACKFILL DE IMAGENS DAS RECEITAS GUARDADAS
+# ------------------------
+# Os endpoints GET nunca chamam o DALL·E: receitas sem imagem entram nesta
+# fila e os workers em background geram e gravam a imagem.
+recipe_image_queue = queue.Queue()
+_recipe_image_pending = set()
+_recipe_image_workers = []
+_recipe_image_lock = threading.Lock()
+
+def recipe_image_status(recipe):
+    if recipe.image_url:
+        return 'ready'
+    if (recipe.image_attempts or 0) >= app.config['RECIPE_IMAGE_MAX_ATTEMPTS']:
+        return 'failed'
+    return 'pending'
+
+def recipe_image_due(recipe):
+    """Receita sem imagem que ainda pode ser tentada (limite de tentativas e
+    espera exponencial depois de cada falha)."""
+    if recipe.image_url:
+        return False
+    attempts = recipe.image_attempts or 0
+    if attempts >= app.config['RECIPE_IMAGE_MAX_ATTEMPTS']:
+        return False
+    if recipe.image_failed_at is None:
+        return True
+    backoff = app.config['RECIPE_IMAGE_RETRY_SECONDS'] * 2 ** max(attempts - 1, 0)
+    return datetime.utcnow() >= recipe.image_failed_at + timedelta(seconds=backoff)
+
+def enqueue_recipe_image_backfill(recipe_id):
+    with _recipe_image_lock:
+        if recipe_id in _recipe_image_pending:
+            return
+        _recipe_image_pending.add(recipe_id)
+
+        _recipe_image_workers[:] = [t for t in _recipe_image_workers if t.is_alive()]
+        while len(_recipe_image_workers) < app.config['RECIPE_IMAGE_BACKFILL_WORKERS']:
+            worker = threading.Thread(
+                target=recipe_image_backfill_worker,
+                name=f"recipe-image-backfill-{len(_recipe_image_workers)}",
+                daemon=True
+            )
+            worker.start()
+            _recipe_image_workers.append(worker)
+    recipe_image_queue.put(recipe_id)
+
+def recipe_image_backfill_worker():
+    while True:
+        recipe_id = recipe_image_queue.get()
+        try:
+            with app.app_context():
+                recipe = RecipeCollection.query.get(recipe_id)
+                if recipe and recipe_image_due(recipe):
+                    image_url = generate_recipe_image_url(recipe_image_prompt(recipe.title))
+                    # Placeholder não é gravado: conta como falha e a receita só
+                    # volta a ser tentada depois do backoff
+                    if image_url != RECIPE_IMAGE_PLACEHOLDER:
+                        recipe.image_url = image_url
+                        logger.info(f"🖼️ Imagem gerada para a receita {recipe_id}")
+                    else:
+                        recipe.image_attempts = (recipe.image_attempts or 0) + 1
+                        recipe.image_failed_at = datetime.utcnow()
+                        logger.warning(f"⚠️ Falha na imagem da receita {recipe_id} (tentativa {recipe.image_attempts})")
+                    db.session.commit()
+        except Exception as e:
+            logger.error(f"❌ Erro no backfill de imagem da receita {recipe_id}: {e}")
+        finally:
+            with _recipe_image_lock:
+                _recipe_image_pending.discard(recipe_id)
+            recipe_image_queue.task_done()
 
 # ------------------------
 # ENDPOINT: /api/recipe-image-generate (POST) usando REST do Azure DALL·E
@@ -3004,7 +5466,55 @@ def recipe_image_generate():
 
     except Exception as e:
         logger.error(f"❌ Erro em /api/recipe-image-generate: {str(e)}")
-        return jsonify({'url': "https://via.placeholder.com/1024"}), 200
+        return jsonify({'url': RECIPE_IMAGE_PLACEHOLDER}), 200
+
+# ------------------------
+# STATUS DE JOBS EM BACKGROUND (GET)
+# ------------------------
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_background_job(job_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Não autenticado'}), 401
+
+    job = BackgroundJob.query.filter_by(id=job_id, user_id=user.id).first()
+    if not job:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify({'job': job.to_dict()}), 200
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_background_job(job_id):
+    """Server-sent events: um evento por mudança de estado até o job terminar."""
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Não autenticado'}), 401
+
+    if not BackgroundJob.query.filter_by(id=job_id, user_id=user.id).first():
+        return jsonify({'error': 'Job não encontrado'}), 404
+
+    def events():
+        deadline = time.monotonic() + app.config['JOB_EVENTS_TIMEOUT_SECONDS']
+        last_status = None
+        while True:
+            db.session.expire_all()
+            job = BackgroundJob.query.get(job_id)
+            if job is None:
+                yield f"event: gone\ndata: {json.dumps({'job_id': job_id})}\n\n"
+                return
+            if job.status != last_status:
+                last_status = job.status
+                yield f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+            if job.status in ('done', 'failed'):
+                return
+            if time.monotonic() > deadline:
+                yield "event: timeout\ndata: {}\n\n"
+                return
+            time.sleep(app.config['JOB_EVENTS_POLL_SECONDS'])
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 # ------------------------
 # AI MEAL ESTIMATION (POST)
@@ -3021,11 +5531,11 @@ def ai_meal_estimation():
     if not description:
         return jsonify({'error': 'Descrição da refeição é obrigatória'}), 400
 
-    estimates = estimate_nutrition_from_text(description)
+    estimates = estimate_nutrition_from_text(description, user_id=user.id)
     if not estimates:
         return jsonify({'error': 'Falha na estimativa nutricional'}), 500
 
-    title = generate_meal_title(description)
+    title = generate_meal_title(description, user_id=user.id)
     conf_map = {'low': 60, 'medium': 80, 'high': 95}
     conf_str = calculate_prediction_confidence(len(user.meal_analyses))
     confidence = conf_map.get(conf_str, 60)
@@ -3037,6 +5547,7 @@ def ai_meal_estimation():
             'protein': estimates['protein'],
             'carbs': estimates['carbs'],
             'fat': estimates['fat'],
+            'partial': estimates.get('partial', False),
             'confidence': confidence
         }
     }), 200
@@ -3168,6 +5679,29 @@ def init_revolutionary_database():
         with db.engine.connect() as conn:
             conn.execute(text("ALTER TABLE user ADD COLUMN profile_photo VARCHAR(200)"))
             conn.commit()
+    meal_columns = [c['name'] for c in inspector.get_columns('meal_analysis')]
+    if 'image_phash' not in meal_columns:
+        with db.engine.connect() as conn:
+            conn.execute(text("ALTER TABLE meal_analysis ADD COLUMN image_phash VARCHAR(16)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_meal_analysis_image_phash ON meal_analysis (image_phash)"))
+            conn.commit()
+    recipe_columns = [c['name'] for c in inspector.get_columns('recipe_collection')]
+    if 'image_attempts' not in recipe_columns:
+        with db.engine.connect() as conn:
+            conn.execute(text("ALTER TABLE recipe_collection ADD COLUMN image_attempts INTEGER NOT NULL DEFAULT 0"))
+            conn.execute(text("ALTER TABLE recipe_collection ADD COLUMN image_failed_at DATETIME"))
+            # Placeholders gravados antes desta versão contam como "sem imagem"
+            conn.execute(
+                text("UPDATE recipe_collection SET image_url = NULL WHERE image_url = :placeholder"),
+                {'placeholder': RECIPE_IMAGE_PLACEHOLDER}
+            )
+            conn.commit()
+    job_columns = [c['name'] for c in inspector.get_columns('background_job')]
+    if 'payload' not in job_columns:
+        with db.engine.connect() as conn:
+            conn.execute(text("ALTER TABLE background_job ADD COLUMN payload TEXT"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_background_job_status ON background_job (status, created_at)"))
+            conn.commit()
 
     legendary_badges = [
         {
@@ -3265,18 +5799,161 @@ def init_revolutionary_database():
 # ------------------------
 # SERVIR IMAGENS (GET)
 # ------------------------
+def send_image_file(directory, name):
+    """
+    Envia uma imagem com ETag forte, Cache-Control imutável e suporte a
+    pedidos condicionais (304) e Range (206). Com ``IMAGE_SENDFILE_MODE`` a
+    transferência dos bytes é delegada ao servidor web.
+    """
+    path = safe_join(directory, name)
+    if not path or not os.path.isfile(path):
+        raise NotFound()
+
+    stat = os.stat(path)
+    etag = hashlib.sha1(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+    mode = app.config['IMAGE_SENDFILE_MODE']
+
+    if mode == 'x-accel-redirect':
+        relative = os.path.relpath(path, app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        mimetype = 'image/webp' if name.endswith('.webp') else 'image/jpeg'
+        response = app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"{app.config['X_ACCEL_REDIRECT_PREFIX']}/{relative}"
+        response.set_etag(etag)
+        response.last_modified = stat.st_mtime
+        response = response.make_conditional(request.environ)
+    else:
+        response = werkzeug_send_file(
+            path,
+            request.environ,
+            etag=etag,
+            conditional=True,
+            use_x_sendfile=(mode == 'x-sendfile'),
+            response_class=app.response_class
+        )
+
+    response.headers['Cache-Control'] = f"public, max-age={app.config['IMAGE_CACHE_MAX_AGE']}, immutable"
+    return response
+
 @app.route('/api/images/<filename>')
 def serve_image(filename):
+    size = request.args.get('size', 'original')
+    if size == 'original':
+        path = blob_store.locate(filename)
+        if not path:
+            return jsonify({'error': 'Image not found'}), 404
+        return send_image_file(os.path.dirname(path), os.path.basename(path))
+
     try:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-    except:
+        size = int(size)
+    except ValueError:
+        size = None
+    if size not in app.config['IMAGE_DERIVATIVE_SIZES']:
+        return jsonify({'error': 'Tamanho de imagem inválido'}), 400
+
+    accepts_webp = any(
+        mimetype == 'image/webp' and quality > 0
+        for mimetype, quality in request.accept_mimetypes
+    )
+    try:
+        name = get_or_create_image_derivative(filename, size, 'WEBP' if accepts_webp else 'JPEG')
+    except Exception as e:
+        logger.error(f"❌ Erro ao gerar derivado de {filename}: {e}")
+        name = None
+    if not name:
         return jsonify({'error': 'Image not found'}), 404
 
+    path = derivative_store.locate(name)
+    response = send_image_file(os.path.dirname(path), name)
+    response.vary.add('Accept')
+    return response
+
+# ------------------------
+# GARBAGE COLLECTION DE UPLOADS (flask gc-uploads)
+# ------------------------
+def referenced_upload_names():
+    """Nomes de todos os ficheiros do blob store ainda referenciados na BD."""
+    names = set()
+    for (image_path,) in db.session.query(MealAnalysis.image_path).filter(MealAnalysis.image_path.isnot(None)):
+        names.add(os.path.basename(image_path))
+    for (image_path,) in db.session.query(SocialFeed.image_path).filter(SocialFeed.image_path.isnot(None)):
+        names.add(os.path.basename(image_path))
+    for (photo,) in db.session.query(User.profile_photo).filter(User.profile_photo.isnot(None)):
+        names.add(photo)
+    for (image_url,) in db.session.query(RecipeCollection.image_url).filter(RecipeCollection.image_url.like('/api/images/%')):
+        names.add(image_url.rsplit('/', 1)[-1])
+    # Fotos de análises assíncronas que ainda não foram gravadas
+    for (payload,) in db.session.query(BackgroundJob.payload).filter(BackgroundJob.status.in_(['pending', 'running'])):
+        image_path = json.loads(payload or '{}').get('image_path')
+        if image_path:
+            names.add(os.path.basename(image_path))
+    return names
+
+def collect_upload_garbage(dry_run=False, min_age_seconds=None):
+    """
+    Apaga os uploads que nenhuma linha da BD referencia e os derivados cujo
+    original já não existe. Ficheiros mais recentes que ``min_age_seconds``
+    nunca são apagados (uploads em curso, receitas geradas ainda não guardadas).
+    """
+    if min_age_seconds is None:
+        min_age_seconds = app.config['UPLOAD_GC_MIN_AGE_SECONDS']
+    cutoff = time.time() - min_age_seconds
+    referenced = referenced_upload_names()
+    stats = Counter()
+
+    live_stems = set()
+    for name, path in blob_store.names():
+        stats['scanned'] += 1
+        stat = os.stat(path)
+        if name in referenced or stat.st_mtime > cutoff:
+            live_stems.add(os.path.splitext(name)[0])
+            continue
+        stats['orphans'] += 1
+        stats['bytes_reclaimed'] += stat.st_size
+        if not dry_run:
+            os.remove(path)
+
+    for name, path in derivative_store.names():
+        stats['derivatives_scanned'] += 1
+        if os.path.splitext(name)[0].rsplit('_', 1)[0] in live_stems:
+            continue
+        stats['derivative_orphans'] += 1
+        stats['bytes_reclaimed'] += os.path.getsize(path)
+        if not dry_run:
+            os.remove(path)
+
+    return dict(stats)
+
+@app.cli.command('gc-uploads')
+@click.option('--dry-run', is_flag=True, help='Só mostra o que seria apagado.')
+@click.option('--min-age-hours', type=float, default=None, help='Idade mínima dos órfãos (default: UPLOAD_GC_MIN_AGE_SECONDS).')
+def gc_uploads_command(dry_run, min_age_hours):
+    """Apaga uploads órfãos (não referenciados por análises, fotos de perfil ou receitas)."""
+    min_age_seconds = min_age_hours * 3600 if min_age_hours is not None else None
+    stats = collect_upload_garbage(dry_run=dry_run, min_age_seconds=min_age_seconds)
+    prefix = '🧪 [dry-run] ' if dry_run else '🧹 '
+    click.echo(f"{prefix}{stats.get('orphans', 0)} uploads e {stats.get('derivative_orphans', 0)} derivados órfãos "
+               f"de {stats.get('scanned', 0)} ficheiros ({stats.get('bytes_reclaimed', 0)} bytes)")
+
+@app.cli.command('build-food-vocabulary')
+@click.argument('sources', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', default=None, help='Ficheiro SQLite (default: FOOD_VOCABULARY_PATH).')
+@click.option('--no-builtin', is_flag=True, help='Não inclui o vocabulário embutido.')
+def build_food_vocabulary_command(sources, output, no_builtin):
+    """Gera o vocabulário alimentar SQLite a partir de ficheiros CSV/JSONL."""
+    output = output or app.config['FOOD_VOCABULARY_PATH']
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    records = [] if no_builtin else [builtin_food_vocabulary_records()]
+    records.extend(read_food_vocabulary_source(source) for source in sources)
+    count = build_food_vocabulary((record for chunk in records for record in chunk), output)
+    click.echo(f"📚 {count} nomes gravados em {output}")
+
 
 if __name__ == '__main__':
     with app.app_context():
         init_revolutionary_database()
         create_demo_user()
+    # Retoma jobs que ficaram pendentes na execução anterior
+    start_background_job_workers()
 
     logger.info("🚀 NUTRIVISION PRO - REVOLUTIONARY AI")
     logger.info("🌐 Server rodando em http://localhost:5001")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+🧪 FAKE AZURE OPENAI SERVER - testes de carga offline
+
+Imita os endpoints de chat completions (GPT-4o) e images/generations
+(DALL·E) do Azure OpenAI, com latência e taxa de erros configuráveis, para
+medir o caminho HTTP real do backend (serialização, pool, timeouts,
+retries) sem gastar tokens.
+
+Uso:
+    python fake_ai_server.py --port 5055 --latency-ms 1200 --jitter-ms 400 --error-rate 0.02
+
+E no backend:
+    export AZURE_OPENAI_ENDPOINT=http://127.0.0.1:5055/
+    export AZURE_DALLE_ENDPOINT=http://127.0.0.1:5055
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import Flask, request, jsonify, send_file
+from PIL import Image
+
+app = Flask(__name__)
+
+# Configuração de latência/erros (substituída pelos argumentos da linha de comando)
+CONFIG = {
+    'latency_dist': 'normal',     # fixed, uniform, normal, lognormal
+    'latency_ms': 800,
+    'jitter_ms': 300,
+    'image_latency_ms': 6000,
+    'error_rate': 0.0,            # fração de respostas 500
+    'rate_limit_rate': 0.0,       # fração de respostas 429
+}
+
+STATS = Counter()
+_stats_lock = threading.Lock()
+
+FAKE_FOODS = [
+    'grilled chicken', 'rice', 'broccoli', 'salmon', 'avocado', 'eggs',
+    'sweet potato', 'quinoa', 'tomato', 'spinach', 'bread', 'cheese'
+]
+
+
+def sample_latency(mean_ms):
+    """Devolve uma latência em segundos segundo a distribuição configurada."""
+    dist = CONFIG['latency_dist']
+    jitter = CONFIG['jitter_ms']
+    if dist == 'fixed':
+        value = mean_ms
+    elif dist == 'uniform':
+        value = random.uniform(mean_ms - jitter, mean_ms + jitter)
+    elif dist == 'lognormal':
+        # Cauda longa, parecida com a de um upstream real
+        sigma = math.sqrt(math.log(1 + (jitter / max(mean_ms, 1)) ** 2))
+        mu = math.log(max(mean_ms, 1)) - sigma ** 2 / 2
+        value = random.lognormvariate(mu, sigma)
+    else:
+        value = random.gauss(mean_ms, jitter)
+    return max(value, 0) / 1000.0
+
+
+def record(name, amount=1):
+    with _stats_lock:
+        STATS[name] += amount
+
+
+def injected_error():
+    """Devolve uma resposta de erro (429/500) de acordo com as taxas configuradas."""
+    roll = random.random()
+    if roll < CONFIG['rate_limit_rate']:
+        record('rate_limited')
+        response = jsonify({'error': {'code': '429', 'message': 'Rate limit exceeded (fake)'}})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    if roll < CONFIG['rate_limit_rate'] + CONFIG['error_rate']:
+        record('errors')
+        return jsonify({'error': {'code': '500', 'message': 'Internal server error (fake)'}}), 500
+    return None
+
+
+def fake_chat_content(system_prompt, user_content):
+    """Escolhe uma resposta plausível conforme o helper que fez a chamada."""
+    foods = random.sample(FAKE_FOODS, 3)
+    if 'alimentos' in system_prompt and 'visão' in system_prompt:
+        return json.dumps(foods)
+    if 'advanced AI nutritionist' in system_prompt:
+        return json.dumps({
+            'is_food': True,
+            'foods_detected': foods,
+            'nutrition': {'calories': random.randint(300, 800), 'protein': 30.0, 'carbs': 50.0, 'fat': 18.0, 'fiber': 7.0},
+            'revolutionary_analysis': {
+                'emotional_score': 4.0, 'addiction_potential': 3.0, 'satisfaction_prediction': 7.5,
+                'energy_timeline': [{'hour': h, 'energy': round(8 - h * 0.5, 1)} for h in range(1, 4)],
+                'sleep_impact': 0.5, 'weight_impact_weekly': 0.02,
+                'eating_personality': 'Balanced Explorer', 'optimal_time': '12:00-14:00'
+            },
+            'health_assessment': {'score': 7.5, 'obesity_risk': 'low', 'metabolic_impact': 'positive'},
+            'ai_insights': 'Fake analysis generated by the local load-test server.',
+            'suggestions': ['Stay hydrated', 'Add more vegetables', 'Eat slowly']
+        })
+    if 'nutrition expert' in system_prompt:
+        return json.dumps({'calories': random.randint(150, 900), 'protein': 20.0, 'carbs': 40.0, 'fat': 12.0})
+    if 'meal titles' in system_prompt:
+        return ' '.join(word.title() for word in user_content.split()[:3]) or 'Simple Meal'
+    if 'culinary expert' in system_prompt:
+        # Lista numerada "1. item": aceita todos os itens
+        return json.dumps([int(line.split('.', 1)[0]) for line in user_content.splitlines() if line.split('.', 1)[0].strip().isdigit()])
+    if 'creative chef' in system_prompt:
+        return json.dumps({
+            'title': f"Fake {random.choice(['Bowl', 'Skillet', 'Salad', 'Wrap'])} #{random.randint(1, 999)}",
+            'description': 'A fake recipe returned by the local load-test server.',
+            'prep_time': 10,
+            'cook_time': 20,
+            'servings': 2,
+            'ingredients': [{'item': food, 'amount': '100 g', 'notes': ''} for food in foods],
+            'instructions': ['Prepare the ingredients', 'Cook them', 'Serve'],
+            'nutrition': {'calories': 450, 'protein': 30, 'carbs': 40, 'fat': 15},
+            'tags': ['fake', 'load-test'],
+            'difficulty': 'beginner',
+            'chef_tips': ['This is a fake tip']
+        })
+    return 'OK'
+
+
+@app.route('/openai/deployments/<deployment>/chat/completions', methods=['POST'])
+def chat_completions(deployment):
+    record('chat_requests')
+    record('chat_bytes_in', request.content_length or 0)
+    time.sleep(sample_latency(CONFIG['latency_ms']))
+    error = injected_error()
+    if error:
+        return error
+
+    data = request.get_json(force=True)
+    messages = data.get('messages', [])
+    system_prompt = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+    user_message = next((m.get('content', '') for m in messages if m.get('role') == 'user'), '')
+    if isinstance(user_message, list):
+        user_message = ' '.join(part.get('text', '') for part in user_message if part.get('type') == 'text')
+
+    content = fake_chat_content(system_prompt, user_message)
+    return jsonify({
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': deployment,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop'
+        }],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    })
+
+
+@app.route('/openai/deployments/<deployment>/images/generations', methods=['POST'])
+def image_generations(deployment):
+    record('image_requests')
+    time.sleep(sample_latency(CONFIG['image_latency_ms']))
+    error = injected_error()
+    if error:
+        return error
+
+    prompt = (request.get_json(force=True) or {}).get('prompt', '')
+    digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+    return jsonify({
+        'created': int(time.time()),
+        'data': [{'url': f"{request.host_url}fake-images/{digest}.png", 'revised_prompt': prompt}]
+    })
+
+
+@app.route('/fake-images/<digest>.png', methods=['GET'])
+def fake_image(digest):
+    record('image_downloads')
+    color = tuple(int(digest[i:i + 2], 16) for i in (0, 2, 4))
+    buffer = io.BytesIO()
+    Image.new('RGB', (1024, 1024), color).save(buffer, format='PNG')
+    buffer.seek(0)
+    return send_file(buffer, mimetype='image/png')
+
+
+@app.route('/fake/stats', methods=['GET'])
+def fake_stats():
+    with _stats_lock:
+        return jsonify({'config': CONFIG, 'stats': dict(STATS)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Azure OpenAI server para testes de carga')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--latency-dist', choices=['fixed', 'uniform', 'normal', 'lognormal'], default=CONFIG['latency_dist'])
+    parser.add_argument('--latency-ms', type=float, default=CONFIG['latency_ms'], help='latência média do chat')
+    parser.add_argument('--jitter-ms', type=float, default=CONFIG['jitter_ms'], help='desvio/amplitude da latência')
+    parser.add_argument('--image-latency-ms', type=float, default=CONFIG['image_latency_ms'], help='latência média do DALL·E')
+    parser.add_argument('--error-rate', type=float, default=CONFIG['error_rate'], help='fração de respostas 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=CONFIG['rate_limit_rate'], help='fração de respostas 429')
+    args = parser.parse_args()
+
+    CONFIG.update({
+        'latency_dist': args.latency_dist,
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'image_latency_ms': args.image_latency_ms,
+        'error_rate': args.error_rate,
+        'rate_limit_rate': args.rate_limit_rate,
+    })
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+import app as nutrivision
+
+
+@pytest.fixture(scope='module')
+def sqlite_vocabulary(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('vocabulary') / 'food_vocabulary.db')
+    records = (
+        {'name': name, 'category': category}
+        for category, names in nutrivision.VALID_FOOD_CATEGORIES.items()
+        for name in names
+    )
+    nutrivision.build_food_vocabulary(records, path)
+    return nutrivision.SQLiteFoodVocabulary(path)
+
+
+def vocabulary_inputs(seed=4321):
+    """Inputs alinhados com palavras: nomes, palavras, prefixos e combinações.
+    Substrings a meio de uma palavra ficam de fora (o SQLite não as procura)."""
+    rnd = random.Random(seed)
+    names = nutrivision.ALL_VALID_INGREDIENTS
+    words = sorted({word for name in names for word in name.split()})
+    inputs = set(names) | set(words) | {'iphone charger', 'cadeira', 'Frango Grelhado', 'xyz'}
+    for name in names:
+        inputs.add(name[:rnd.randrange(1, len(name) + 1)])
+    for _ in range(500):
+        inputs.add(' '.join(rnd.choice(words + ['foo', 'bar', 'pa']) for _ in range(rnd.randint(1, 3))))
+        inputs.add(rnd.choice(names) + rnd.choice(['', ' frito', ' com arroz']))
+    return sorted(text for text in inputs if text.strip())
+
+
+def mid_word_inputs(seed=4321):
+    rnd = random.Random(seed)
+    inputs = {'chickenbreast', 'icke', 'xyz'}
+    for name in nutrivision.ALL_VALID_INGREDIENTS:
+        start = rnd.randrange(len(name) + 1)
+        inputs.add(name[start:rnd.randrange(start, len(name) + 1)])
+        inputs.add(name + 'x')
+    return sorted(text for text in inputs if text.strip())
+
+
+def test_food_vocabulary_is_abstract():
+    with pytest.raises(TypeError):
+        nutrivision.FoodVocabulary()
+
+
+def test_sqlite_and_builtin_vocabularies_agree(sqlite_vocabulary):
+    builtin = nutrivision.BuiltinFoodVocabulary()
+    mismatches = [
+        text for text in vocabulary_inputs()
+        if builtin.matches(text) != sqlite_vocabulary.matches(text)
+    ]
+    assert mismatches == []
+
+
+def test_sqlite_vocabulary_accepts_nothing_builtin_rejects(sqlite_vocabulary):
+    builtin = nutrivision.BuiltinFoodVocabulary()
+    extra = [text for text in mid_word_inputs() if sqlite_vocabulary.matches(text) and not builtin.matches(text)]
+    assert extra == []
+    assert not sqlite_vocabulary.matches('chickenbreast')
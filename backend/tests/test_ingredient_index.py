@@ -0,0 +1,81 @@
+import random
+
+import app as nutrivision
+
+ALL_VALID_INGREDIENTS = nutrivision.ALL_VALID_INGREDIENTS
+
+
+def linear_scan_matches(text):
+    """A verificação antiga de validate_ingredients, nome a nome."""
+    return any(
+        text in valid_ingredient
+        or valid_ingredient in text
+        or len(set(text.split()) & set(valid_ingredient.split())) > 0
+        for valid_ingredient in ALL_VALID_INGREDIENTS
+    )
+
+
+def linear_scan_similar(text, limit=3):
+    """O antigo find_similar_ingredients, nome a nome."""
+    words = set(text.split())
+    similar = [
+        valid_ingredient for valid_ingredient in ALL_VALID_INGREDIENTS
+        if words & set(valid_ingredient.split()) or any(valid_ingredient.startswith(word) for word in words)
+    ]
+    return similar[:limit]
+
+
+def generated_inputs(seed=1234):
+    rnd = random.Random(seed)
+    words = sorted({word for name in ALL_VALID_INGREDIENTS for word in name.split()})
+    noise = ['foo', 'bar', 'xyz', 'ch', 'pa', 'sal', 'iphone', 'charger']
+    inputs = set(ALL_VALID_INGREDIENTS) | set(words)
+    inputs |= {'x', 'a', 'o', 'pizza', 'iphone charger', 'grilled chicken breast', 'tomate', 'chick', 'de', 'oil'}
+    for name in ALL_VALID_INGREDIENTS:
+        for _ in range(3):
+            start = rnd.randrange(len(name) + 1)
+            inputs.add(name[start:rnd.randrange(start, len(name) + 1)])
+    for _ in range(2000):
+        inputs.add(' '.join(rnd.choice(words + noise)[:rnd.randint(1, 12)] for _ in range(rnd.randint(1, 3))))
+        inputs.add(rnd.choice(ALL_VALID_INGREDIENTS) + rnd.choice(['', 's', ' frito', '-x']))
+        inputs.add(''.join(rnd.choice('abcdeiloprstuçãé ') for _ in range(rnd.randint(1, 10))))
+    # Texto vazio deixou de validar de propósito (uma quantidade sozinha não é comida)
+    return sorted({text.lower().strip() for text in inputs} - {''})
+
+
+def test_matches_agrees_with_linear_scan():
+    mismatches = [
+        text for text in generated_inputs()
+        if nutrivision.INGREDIENT_INDEX.matches(text) != linear_scan_matches(text)
+    ]
+    assert mismatches == []
+
+
+def test_similar_agrees_with_linear_scan():
+    mismatches = [
+        text for text in generated_inputs()
+        if nutrivision.INGREDIENT_INDEX.similar(text) != linear_scan_similar(text)
+    ]
+    assert mismatches == []
+
+
+def test_empty_text_does_not_match():
+    assert not nutrivision.INGREDIENT_INDEX.matches('')
+    assert not nutrivision.INGREDIENT_INDEX.matches('   ')
+
+
+NON_FOOD_INPUTS = ['power bank', 'spoon', 'sponge', 'report', 'tipo', 'grow light']
+
+
+def test_non_food_inputs_are_rejected_like_the_linear_scan():
+    for text in NON_FOOD_INPUTS:
+        assert not linear_scan_matches(text)
+        assert not nutrivision.INGREDIENT_INDEX.matches(text)
+        assert not nutrivision.NORMALIZED_INGREDIENT_INDEX.matches(text)
+    assert nutrivision.validate_ingredients(NON_FOOD_INPUTS)['valid_items'] == []
+
+
+def test_short_stems_keep_their_ending():
+    assert nutrivision.normalize_ingredient('pão') == nutrivision.normalize_ingredient('pães') == 'pao'
+    assert nutrivision.normalize_ingredient('grão') == 'grao'
+    assert nutrivision.normalize_ingredient('limões') == nutrivision.normalize_ingredient('limão')
@@ -0,0 +1,36 @@
+import app as nutrivision
+
+
+def test_parse_quantity_number_mixed_fraction():
+    assert nutrivision.parse_quantity_number('1 1/2') == 1.5
+
+
+def test_parse_quantity_number_zero_denominator():
+    assert nutrivision.parse_quantity_number('1/0') is None
+    assert nutrivision.parse_quantity_number('1 1/0') is None
+
+
+def test_zero_denominator_does_not_break_translation():
+    quantity, unit, rest = nutrivision.parse_ingredient_quantity('1 1/0 ovos')
+    assert quantity is None
+    assert rest == 'ovos'
+    assert nutrivision.translate_ingredient('1 1/0 ovos')['name'] == 'eggs'
+
+
+def test_bare_quantity_is_not_an_ingredient():
+    assert nutrivision.translate_ingredient('2')['name'] == '2'
+    assert not nutrivision.INGREDIENT_INDEX.matches('')
+    result = nutrivision.validate_ingredients(['2', '½', 'ovos'])
+    assert result['valid_items'] == ['ovos']
+    assert result['invalid_items'] == ['2', '½']
+
+
+def test_partial_translations_keep_the_original_phrase():
+    for phrase in ['leite de coco', 'pão de forma', 'sal e pimenta', 'café com leite']:
+        assert nutrivision.translate_ingredient(phrase)['name'] == phrase
+    assert nutrivision.translate_ingredient('200g de leite de coco')['name'] == 'leite de coco'
+
+
+def test_full_translations_still_apply():
+    assert nutrivision.translate_ingredient('frango grelhado com arroz')['name'] == 'grilled chicken with rice'
+    assert nutrivision.translate_ingredient('2 ovos')['name'] == 'eggs'
@@ -0,0 +1,46 @@
+import app as nutrivision
+
+
+def test_connectors_split_only_when_every_part_resolves():
+    local = nutrivision.estimate_nutrition_locally('2 eggs and toast')
+    assert [item['food'] for item in local['resolved']] == ['egg', 'bread']
+    assert local['unresolved'] == []
+
+    local = nutrivision.estimate_nutrition_locally('mac and cheese, 1 banana')
+    assert [item['food'] for item in local['resolved']] == ['banana']
+    assert local['unresolved'] == ['mac and cheese']
+
+
+def test_failed_model_keeps_local_part(monkeypatch):
+    monkeypatch.setattr(nutrivision, 'ai_estimate_nutrition', lambda description: None)
+    estimate = nutrivision.estimate_nutrition_from_text('1 banana, kimchi stew')
+    assert estimate['partial'] is True
+    assert estimate['calories'] == round(89 * 1.2)
+    assert nutrivision.estimate_nutrition_from_text('kimchi stew') is None
+
+
+def test_normalized_description_keeps_quantities_with_items():
+    normalize = nutrivision.normalize_meal_description
+    assert normalize('2 eggs 1 toast') != normalize('1 eggs 2 toast')
+    assert normalize('2 eggs, 1 toast') == normalize('1 toast and 2 eggs!')
+    assert normalize('Lasagna with salad') == normalize('LASAGNA, salad')
+
+
+def test_cans_use_per_food_weight_or_stay_unresolved():
+    local = nutrivision.estimate_nutrition_locally('1 can of tuna')
+    assert [(item['food'], item['grams']) for item in local['resolved']] == [('tuna', 120.0)]
+    assert nutrivision.estimate_nutrition_locally('1 can of soup')['unresolved'] == ['1 can of soup']
+
+
+def test_bare_salad_is_not_lettuce():
+    local = nutrivision.estimate_nutrition_locally('salad')
+    assert local['resolved'] == []
+    assert local['unresolved'] == ['salad']
+
+
+def test_joined_milk_is_a_side_portion():
+    for description in ('coffee with milk', 'café com leite'):
+        local = nutrivision.estimate_nutrition_locally(description)
+        assert [(item['food'], item['grams']) for item in local['resolved']] == [('coffee', 240.0), ('milk', 50.0)]
+    local = nutrivision.estimate_nutrition_locally('cereal with 200 ml milk')
+    assert local['resolved'][-1]['grams'] == 200.0
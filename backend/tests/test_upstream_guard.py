@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+import app as nutrivision
+
+
+@pytest.fixture
+def guard(monkeypatch):
+    monkeypatch.setitem(nutrivision.app.config, 'AI_BREAKER_FAILURE_THRESHOLD', 1)
+    monkeypatch.setitem(nutrivision.app.config, 'AI_BREAKER_RESET_SECONDS', 0)
+    monkeypatch.setitem(nutrivision.app.config, 'AI_MAX_RETRIES', 0)
+    return nutrivision.UpstreamGuard('test')
+
+
+def open_breaker(guard):
+    def fail():
+        raise ConnectionError('down')
+    with pytest.raises(ConnectionError):
+        guard.call(fail)
+    assert guard.state == 'open'
+
+
+def test_half_open_lets_a_single_probe_through(guard):
+    open_breaker(guard)
+    probe_started = threading.Event()
+    release_probe = threading.Event()
+
+    def slow_probe():
+        probe_started.set()
+        release_probe.wait(5)
+        return 'ok'
+
+    results = []
+    probe = threading.Thread(target=lambda: results.append(guard.call(slow_probe)))
+    probe.start()
+    assert probe_started.wait(5)
+
+    with pytest.raises(nutrivision.UpstreamUnavailableError):
+        guard.call(lambda: 'second')
+
+    release_probe.set()
+    probe.join(5)
+    assert results == ['ok']
+    assert guard.state == 'closed'
+    assert guard.call(lambda: 'after') == 'after'
+
+
+def test_failed_probe_reopens_and_frees_the_slot(guard):
+    open_breaker(guard)
+    open_breaker(guard)
+    assert not guard.probe_in_flight
+    assert guard.call(lambda: 'ok') == 'ok'